@@ -1,3 +1,5 @@
+import select
+import zlib
 from contextlib import contextmanager
 
 from django.db import transaction
@@ -16,3 +18,99 @@ def exclusive_insert_table_lock(model):
             yield
         finally:
             cursor.close()
+
+
+def _int4(value):
+    return (value + 2 ** 31) % 2 ** 32 - 2 ** 31
+
+
+# See also https://www.postgresql.org/docs/current/explicit-locking.html#ADVISORY-LOCKS
+# Serializes the transactions that use the same model and key (e.g. the insertions of the child rows of one parent row)
+# without blocking any other access to the table. The lock is released at the end of the transaction.
+@contextmanager
+def advisory_transaction_lock(model, key):
+    with transaction.atomic():
+        with get_connection().cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                           (_int4(zlib.crc32(model._meta.db_table.encode())), _int4(key)))
+        yield
+
+
+def _in_flight_key(model):
+    # The advisory locks of the identifiers in flight are keyed by the table and the (lower 32 bits of the) identifier,
+    # so they neither conflict with the other advisory locks (e.g. of advisory_transaction_lock(...)) nor are counted by
+    # allocation_horizon(...) if they are of another table.
+    return _int4(zlib.crc32(f"{model._meta.db_table}.in_flight".encode()))
+
+
+# Allocates the identifiers of new rows from the sequence of the primary key, e.g. to know them before the rows are
+# inserted, and marks them as in flight with an advisory lock on the smallest one until the context is exited (e.g.
+# after the transaction that inserts the rows), or, within a transaction, until its end. The identifiers are ascending
+# and never reused, even if they are never inserted. The lock is also released when the connection is closed, e.g. if
+# the process dies.
+# The context should be as short as possible, as readers that page by identifier stop below the identifiers in flight.
+@contextmanager
+def in_flight_ids(model, count):
+    if count == 0:
+        yield []
+        return
+    connection = get_connection()
+    in_transaction = connection.in_atomic_block
+    lock_function = "pg_advisory_xact_lock" if in_transaction else "pg_advisory_lock"
+    key = _in_flight_key(model)
+    with connection.cursor() as cursor:
+        # The identifiers are locked by the statement that allocates them, so that no reader misses them.
+        cursor.execute("WITH ids AS (SELECT nextval(pg_get_serial_sequence(%s, %s)) AS id FROM generate_series(1, %s)) "
+                       f"SELECT array_agg(id ORDER BY id), {lock_function}(%s, "
+                       "((min(id) + 2147483648) %% 4294967296 - 2147483648)::integer) FROM ids",
+                       (model._meta.db_table, model._meta.pk.column, count, key))
+        ids = cursor.fetchone()[0]
+    try:
+        yield ids
+    finally:
+        if not in_transaction:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s, %s)", (key, _int4(ids[0])))
+
+
+# The smallest identifier of a table that is in flight (see in_flight_ids(...)), or None. The rows with smaller
+# identifiers are either inserted or never will be, so readers that page through the rows by their identifiers (e.g.
+# with a cursor or a checkpoint) and stop below it do not skip rows that are committed later, even though the
+# identifiers are allocated before the rows are inserted.
+def allocation_horizon(model):
+    with get_connection().cursor() as cursor:
+        # The two keys are in classid and objid (as unsigned 32 bit integers). The identifiers in flight are restored
+        # from their lower 32 bits and the last allocated identifier, which is at most 2 ** 32 ahead of them.
+        cursor.execute("SELECT min(last_value - (last_value - objid::bigint) %% 4294967296) "
+                       "FROM pg_locks, pg_sequence_last_value(pg_get_serial_sequence(%s, %s)::regclass) AS last_value "
+                       "WHERE locktype = 'advisory' AND objsubid = 2 AND classid::bigint = %s "
+                       "AND database = (SELECT oid FROM pg_database WHERE datname = current_database())",
+                       (model._meta.db_table, model._meta.pk.column, _in_flight_key(model) % 2 ** 32))
+        return cursor.fetchone()[0]
+
+
+# See also https://www.postgresql.org/docs/current/sql-notify.html
+def notify(channel, payload=""):
+    with get_connection().cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+
+
+def listen(channel):
+    with get_connection().cursor() as cursor:
+        cursor.execute(f"LISTEN {channel}")
+
+
+# Waits until a notification of a channel that is listened to arrives or the timeout (in seconds) expires.
+# The notifications are consumed without being returned, i.e. they are only used to wake up.
+def wait_for_notification(timeout):
+    connection = get_connection()
+    connection.ensure_connection()
+    readable, _, _ = select.select((connection.connection.fileno(),), (), (), timeout)
+    if readable:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        # psycopg2 collects the notifications in a list.
+        notifies = getattr(connection.connection, "notifies", None)
+        if isinstance(notifies, list):
+            notifies.clear()
+    return bool(readable)
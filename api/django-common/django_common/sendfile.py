@@ -0,0 +1,55 @@
+import os
+from os import environ
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import HttpResponse
+
+"""
+To let the web server send files with sendfile instead of streaming them through Python, add the following to the .env
+file:
+
+# "nginx" (X-Accel-Redirect header) or "x-sendfile" (X-Sendfile header of Apache and lighttpd).
+DJANGO_SENDFILE_MODE=nginx
+# The directory that is served by the web server (default: MEDIA_ROOT).
+DJANGO_SENDFILE_ROOT=
+# The URL prefix of the internal location of nginx that serves the directory.
+DJANGO_SENDFILE_URL=/protected/
+
+And this to the nginx configuration:
+
+location /protected/ {
+    internal;
+    alias /path/to/media/;
+}
+"""
+
+SENDFILE_MODE = environ.get("DJANGO_SENDFILE_MODE")
+SENDFILE_ROOT = environ.get("DJANGO_SENDFILE_ROOT")
+SENDFILE_URL = environ.get("DJANGO_SENDFILE_URL", "/protected/")
+
+
+def is_sendfile_enabled():
+    return bool(SENDFILE_MODE)
+
+
+def sendfile_response(absolute_path, content_type=None):
+    """
+    Creates an empty response with the header that tells the web server to send the file itself.
+    """
+    root = os.path.abspath(SENDFILE_ROOT or settings.MEDIA_ROOT)
+    absolute_path = os.path.abspath(absolute_path)
+    if os.path.commonpath((root, absolute_path)) != root:
+        raise SuspiciousFileOperation(f"The file {absolute_path} is not located in {root}.")
+    response = HttpResponse(content_type=content_type)
+    match SENDFILE_MODE:
+        case "nginx":
+            response["X-Accel-Redirect"] = quote(
+                SENDFILE_URL.rstrip("/") + "/" + os.path.relpath(absolute_path, root).replace(os.sep, "/")
+            )
+        case "x-sendfile":
+            response["X-Sendfile"] = absolute_path
+        case _:
+            raise ImproperlyConfigured(f"Unknown sendfile mode: {SENDFILE_MODE}")
+    return response
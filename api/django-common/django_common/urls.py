@@ -1,8 +1,10 @@
+import mimetypes
 import re
 
 from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import path, re_path
+from django.utils._os import safe_join
 from django.views.static import serve
 from rest_framework.permissions import AllowAny
 from rest_framework.routers import DefaultRouter
@@ -10,6 +12,7 @@ from rest_framework.serializers import ListSerializer, ModelSerializer
 
 from .access import _get_field_access, _has_access
 from .clazz import create_dynamic_class
+from .sendfile import is_sendfile_enabled, sendfile_response
 from .string import camel_case_class_to_snake_case_string
 from .views import _bake_all_base_filter_view_sets
 
@@ -19,7 +22,12 @@ def protected_serve(request, path, document_root=None, show_indexes=False):
     """
     Example:
         urlpatterns = (...) + static_path(settings.MEDIA_URL, protected_serve, document_root=settings.MEDIA_ROOT)
+
+    The file is sent by the web server if sendfile is enabled (see sendfile.py).
     """
+    if is_sendfile_enabled():
+        absolute_path = safe_join(document_root, path)
+        return sendfile_response(absolute_path, mimetypes.guess_type(absolute_path)[0] or "application/octet-stream")
     return serve(request, path, document_root, show_indexes)
 
 
@@ -3,7 +3,7 @@ from datetime import datetime as dt
 from django.contrib import admin
 from hurry.filesize import size as hr_size
 
-from .models import FileUpload
+from .models import FileUpload, FileUploadBatch
 
 DATE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
@@ -11,6 +11,8 @@ DATE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 class FileUploadAdmin(admin.ModelAdmin):
     list_display = ("name", "uploaded_by", "uploaded_on", "detected_mime_type", "hr_size", "checksum")
     readonly_fields = ("file_upload_batch", "position", "file", "detected_mime_type", "checksum")
+    # The columns are rendered from the database alone, without accessing the storage.
+    list_select_related = ("file_upload_batch__owner",)
 
     def hr_size(self, file_upload: FileUpload):
         return hr_size(file_upload.size)
@@ -18,12 +20,12 @@ class FileUploadAdmin(admin.ModelAdmin):
     hr_size.short_description = "Size"
 
     def uploaded_on(self, file_upload: FileUpload):
-        return dt.strftime(file_upload.batch.uploaded_on, DATE_TIME_FORMAT)
+        return dt.strftime(file_upload.file_upload_batch.uploaded_on, DATE_TIME_FORMAT)
 
     uploaded_on.short_description = "Uploaded on"
 
     def uploaded_by(self, file_upload: FileUpload):
-        return file_upload.batch.owner
+        return file_upload.file_upload_batch.owner
 
     uploaded_by.short_description = "Uploaded by"
 
@@ -47,8 +49,15 @@ class FileUploadAdminInline(admin.TabularInline):
 
 
 class FileUploadBatchAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "owner", "uploaded_on", "file_count", "hr_total_size", "deleted_on")
+    list_select_related = ("owner",)
     inlines = (FileUploadAdminInline,)
 
+    def hr_total_size(self, file_upload_batch: FileUploadBatch):
+        return hr_size(file_upload_batch.total_size)
+
+    hr_total_size.short_description = "Total size"
+
     def has_add_permission(self, request):
         return False
 
@@ -0,0 +1,54 @@
+import zipfile
+
+from python_utilities.crypto import FILE_READ_BUFFER_SIZE
+
+MANIFEST_NAME = "SHA256SUMS"
+
+
+class _StreamBuffer:
+    """
+    A write-only file-like object. As it is not seekable, the ZipFile class writes the sizes and the CRC of an entry
+    after its data (data descriptor) and never seeks back, so the archive can be sent while it is written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def stream_zip(entries, date_time):
+    """
+    Yields a ZIP archive (with ZIP64 extensions where needed) in constant memory.
+    The entries are (name, size, checksum, open_file, compress_type) tuples. A manifest with the SHA-256 checksums of
+    the entries which can be verified with "sha256sum -c SHA256SUMS" is added at the end of the archive.
+    """
+    buffer = _StreamBuffer()
+    manifest = []
+    with zipfile.ZipFile(buffer, mode="w", allowZip64=True) as archive:
+        for name, size, checksum, open_file, compress_type in entries:
+            zip_info = zipfile.ZipInfo(name, date_time=date_time)
+            zip_info.compress_type = compress_type
+            # Lets the ZipFile class decide whether the entry needs the ZIP64 extensions.
+            zip_info.file_size = size
+            with open_file() as source, archive.open(zip_info, mode="w") as destination:
+                while True:
+                    data = source.read(FILE_READ_BUFFER_SIZE)
+                    if not data:
+                        break
+                    destination.write(data)
+                    yield from buffer.drain()
+            yield from buffer.drain()
+            if checksum:
+                manifest.append(f"{checksum}  {name}\n")
+        archive.writestr(zipfile.ZipInfo(MANIFEST_NAME, date_time=date_time), "".join(manifest))
+    yield from buffer.drain()
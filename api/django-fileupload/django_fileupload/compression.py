@@ -0,0 +1,87 @@
+import gzip
+import re
+import zlib
+from os import environ
+
+from django.core.files import File
+
+# Compresses text files (see is_text_mime_type) while they are stored, "gzip" or empty to disable the compression.
+COMPRESSION = environ.get("DJANGO_FILEUPLOAD_COMPRESSION", "")
+COMPRESSION_LEVEL = int(environ.get("DJANGO_FILEUPLOAD_COMPRESSION_LEVEL", 6))
+
+GZIP = "gzip"
+
+_quality_pattern = re.compile(r"^\s*q\s*=\s*([0-9.]+)\s*$", re.IGNORECASE)
+
+
+def _parse_accept_encoding(accept_encoding):
+    """Maps the content codings of an Accept-Encoding header to their quality values (q=0 means not acceptable)."""
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, *parameters = coding.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            match = _quality_pattern.match(parameter)
+            if match:
+                try:
+                    quality = float(match.group(1))
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    return qualities
+
+
+def accepts_content_encoding(request, content_encoding):
+    if content_encoding != GZIP:
+        return False
+    qualities = _parse_accept_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    # An explicit coding takes precedence over the wildcard.
+    for name in (GZIP, "x-gzip", "*"):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+class GzipCompressedFile(File):
+    """
+    Compresses the content of a file while the storage writes it.
+    """
+    content_encoding = GZIP
+
+    def __init__(self, file):
+        super().__init__(file, file.name)
+        self.checksum = getattr(file, "checksum", None)
+
+    def chunks(self, chunk_size=None):
+        # The window bits of 31 select the gzip container format.
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+        for chunk in self.file.chunks(chunk_size):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class _GzipDecompressedFile(gzip.GzipFile):
+    """
+    Also closes the compressed file.
+    """
+
+    def __init__(self, file):
+        super().__init__(fileobj=file, mode="rb")
+        self._compressed_file = file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._compressed_file.close()
+
+
+def open_decompressed(file, content_encoding):
+    if content_encoding == GZIP:
+        return _GzipDecompressedFile(file)
+    return file
@@ -0,0 +1,75 @@
+import sys
+from array import array
+from os import environ
+
+# The byte offset of every this number of lines of a text file is stored in its line index (0 to disable the index).
+LINE_INDEX_INTERVAL = int(environ.get("DJANGO_FILEUPLOAD_LINE_INDEX_INTERVAL", 1000))
+
+NEWLINE = b"\n"
+
+
+def pack_offsets(offsets):
+    """Packs the offsets as unsigned 64-bit little-endian integers."""
+    offsets = array("Q", offsets)
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def unpack_offset(packed_offsets, i):
+    return int.from_bytes(packed_offsets[i * 8:(i + 1) * 8], "little")
+
+
+class LineIndexBuilder:
+    """
+    Collects the byte offsets of the lines interval, 2 * interval, ... (counted from 0) of a file from its consecutive
+    chunks, e.g. while it is uploaded.
+    """
+
+    def __init__(self, interval=LINE_INDEX_INTERVAL):
+        self.interval = interval
+        self.offsets = array("Q")
+        self.newline_count = 0
+        self.size = 0
+        self.ends_with_newline = True
+
+    def update(self, data):
+        count = data.count(NEWLINE)
+        next_line = (len(self.offsets) + 1) * self.interval
+        position = 0
+        # Line n starts after the n-th newline, which is only searched in the chunks that contain a line of the index.
+        while self.newline_count + count >= next_line:
+            position = self._find_newline(data, position, next_line - self.newline_count)
+            self.offsets.append(self.size + position + 1)
+            next_line += self.interval
+        self.newline_count += count
+        self.size += len(data)
+        if data:
+            self.ends_with_newline = data.endswith(NEWLINE)
+        return self
+
+    @staticmethod
+    def _find_newline(data, start, n):
+        # Bisects the position of the n-th newline of the data with counts, which are much faster than a search for
+        # each newline.
+        n -= data.count(NEWLINE, 0, start)
+        low, high = start, len(data) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if data.count(NEWLINE, start, middle + 1) >= n:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    @property
+    def line_count(self):
+        # The last line may not end with a newline.
+        return self.newline_count + (0 if self.ends_with_newline else 1)
+
+    @classmethod
+    def from_file(cls, file, interval=LINE_INDEX_INTERVAL, chunk_size=65536):
+        builder = cls(interval)
+        for data in iter(lambda: file.read(chunk_size), b""):
+            builder.update(data)
+        return builder
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from django_fileupload.models import FileUploadBatch
+
+FILE_UPLOAD_BATCHES = "file_upload_batches"
+MAXIMUM_AGE = "maximum_age"
+
+
+class Command(BaseCommand):
+    """
+    Marks file upload batches as deleted with a single statement. Their file uploads and files are deleted in the
+    background by the file_upload_deleter management command.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--%s" % FILE_UPLOAD_BATCHES, nargs="+", type=int, default=[],
+                            help="The ids of the file upload batches.")
+        parser.add_argument("--%s" % MAXIMUM_AGE, required=False, type=int,
+                            help="Delete the file upload batches that are older than this number of hours.")
+
+    def handle(self, *args, **options):
+        if not options[FILE_UPLOAD_BATCHES] and options[MAXIMUM_AGE] is None:
+            print("No file upload batches to delete")
+            return
+        file_upload_batches = FileUploadBatch.objects.none()
+        if options[FILE_UPLOAD_BATCHES]:
+            file_upload_batches |= FileUploadBatch.objects.filter(pk__in=options[FILE_UPLOAD_BATCHES])
+        if options[MAXIMUM_AGE] is not None:
+            file_upload_batches |= FileUploadBatch.objects.filter(
+                uploaded_on__lt=timezone.now() - timedelta(hours=options[MAXIMUM_AGE])
+            )
+        print("Marked", FileUploadBatch.mark_deleted(file_upload_batches), "file upload batches as deleted")
@@ -0,0 +1,63 @@
+from collections import defaultdict
+from os.path import basename
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from python_utilities.crypto import generate_merkle_root
+
+from django_fileupload.models import FileUpload, FileUploadBatch
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Backfills the sizes of the file uploads and the statistics (and the Merkle roots) of the batches that were uploaded
+    before they were maintained on insertion and deletion.
+    """
+
+    def handle(self, *args, **options):
+        count = 0
+        while True:
+            file_uploads = list(FileUpload.objects.filter(original_size__isnull=True, content_encoding="")[:CHUNK_SIZE])
+            if not file_uploads:
+                break
+            for file_upload in file_uploads:
+                try:
+                    file_upload.original_size = file_upload.file.size
+                except FileNotFoundError:
+                    print("Missing file:", file_upload.path)
+                    file_upload.original_size = 0
+            FileUpload.objects.bulk_update(file_uploads, ("original_size",))
+            count += len(file_uploads)
+            print("Backfilled the size of", count, "file uploads")
+
+        count = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # Locking the batches defers the statistics updates of concurrent insertions and deletions, which are
+                # then added to the recalculated statistics.
+                file_upload_batches = list(FileUploadBatch.objects.select_for_update().filter(id__gt=last_id)
+                                           .order_by("id")[:CHUNK_SIZE])
+                if not file_upload_batches:
+                    break
+                file_uploads = defaultdict(list)
+                for file_upload_batch_id, file_name, position, checksum, original_size in FileUpload.objects.filter(
+                        file_upload_batch__in=file_upload_batches
+                ).order_by("position").values_list("file_upload_batch_id", "file", "position", "checksum",
+                                                   "original_size"):
+                    file_uploads[file_upload_batch_id].append((basename(file_name), position, checksum, original_size))
+                for file_upload_batch in file_upload_batches:
+                    batch_file_uploads = file_uploads[file_upload_batch.id]
+                    file_upload_batch.file_count = len(batch_file_uploads)
+                    file_upload_batch.total_size = sum(size for *_, size in batch_file_uploads)
+                    file_upload_batch.file_names = [name for name, *_ in batch_file_uploads]
+                    file_upload_batch.merkle_root = generate_merkle_root(
+                        FileUploadBatch.generate_merkle_leaves(leaf for _, *leaf in batch_file_uploads)
+                    )
+                FileUploadBatch.objects.bulk_update(file_upload_batches,
+                                                    ("file_count", "total_size", "file_names", "merkle_root"))
+            last_id = file_upload_batches[-1].id
+            count += len(file_upload_batches)
+            print("Backfilled the statistics of", count, "batches")
@@ -0,0 +1,243 @@
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import BaseCommand
+from django.db import connection, connections
+from django.test.utils import (CaptureQueriesContext, override_settings, setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from django_fileupload.compression import COMPRESSION
+from django_fileupload.models import ASYNCHRONOUS_PROCESSING, DEDUPLICATION
+from django_fileupload.views import FileUploadBatchViewSet, FileUploadViewSet
+
+FILES = "files"
+SIZES = "sizes"
+REPETITIONS = "repetitions"
+CONCURRENCY = "concurrency"
+CONCURRENT_FILES = "concurrent_files"
+CONCURRENT_SIZE = "concurrent_size"
+LARGE_SIZE = "large_size"
+RANGE_SIZE = "range_size"
+SEED = "seed"
+OUTPUT = "output"
+
+
+def _percentile(values, percent):
+    # Nearest-rank percentile.
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))]
+
+
+def _read_status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+
+
+# See also https://www.kernel.org/doc/html/latest/admin-guide/mm/soft-dirty.html
+def _reset_peak_rss():
+    # Resets the peak RSS of the process to its current RSS (Linux only) and returns it, or None if it cannot be reset.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return None
+    return _read_status("VmRSS")
+
+
+class Command(BaseCommand):
+    """
+    Measures the throughput of uploads and downloads against a test database (created from the default database like
+    the test runner does, and destroyed afterwards) and a temporary storage directory, without a network.
+    The viewsets are called in-process with the configured file upload handlers. Projects can subclass the command to
+    measure their own viewsets.
+    The results are written as JSON, so that they can be compared across commits.
+    """
+    file_upload_batch_viewset_class = FileUploadBatchViewSet
+    file_upload_viewset_class = FileUploadViewSet
+
+    def add_arguments(self, parser):
+        parser.add_argument("--%s" % FILES, nargs="+", type=int, default=[1, 10, 100],
+                            help="The numbers of files per batch.")
+        parser.add_argument("--%s" % SIZES, nargs="+", type=int, default=[1024, 1048576],
+                            help="The sizes of the files in bytes.")
+        parser.add_argument("--%s" % REPETITIONS, type=int, default=5)
+        parser.add_argument("--%s" % CONCURRENCY, type=int, default=4, help="The number of concurrent uploaders.")
+        parser.add_argument("--%s" % CONCURRENT_FILES, type=int, default=10)
+        parser.add_argument("--%s" % CONCURRENT_SIZE, type=int, default=1048576)
+        parser.add_argument("--%s" % LARGE_SIZE, type=int, default=268435456,
+                            help="The size of the large single file in bytes (0 to skip it and the downloads).")
+        parser.add_argument("--%s" % RANGE_SIZE, type=int, default=65536,
+                            help="The size of the byte ranges of the range downloads.")
+        parser.add_argument("--%s" % SEED, type=int, default=0)
+        parser.add_argument("--%s" % OUTPUT, type=str, help="The JSON file (default: standard output).")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options[SEED])
+        self.factory = APIRequestFactory()
+        setup_test_environment()
+        old_database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        media_root = tempfile.mkdtemp(prefix="file_upload_benchmark")
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                self.user = get_user_model().objects.create_user("file_upload_benchmark")
+                results = {
+                    "environment": {
+                        "python": platform.python_version(),
+                        "django": django.get_version(),
+                        "database": connection.vendor,
+                        "cpu_count": os.cpu_count(),
+                        "file_upload_handlers": settings.FILE_UPLOAD_HANDLERS,
+                        "compression": COMPRESSION,
+                        "deduplication": DEDUPLICATION,
+                        "asynchronous_processing": ASYNCHRONOUS_PROCESSING,
+                    },
+                    "options": {k: options[k] for k in (FILES, SIZES, REPETITIONS, CONCURRENCY, CONCURRENT_FILES,
+                                                        CONCURRENT_SIZE, LARGE_SIZE, RANGE_SIZE, SEED)},
+                    "scenarios": self.run(options),
+                }
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            shutil.rmtree(media_root, ignore_errors=True)
+            teardown_test_environment()
+        output = json.dumps(results, indent=2)
+        if options[OUTPUT]:
+            with open(options[OUTPUT], "w") as f:
+                f.write(output)
+        else:
+            print(output)
+
+    def run(self, options):
+        scenarios = []
+        for count in options[FILES]:
+            for size in options[SIZES]:
+                scenarios.append(self.measure(
+                    {"name": "upload", "files": count, "size": size},
+                    [lambda c=count, s=size: self.prepare_upload(c, s) for _ in range(options[REPETITIONS])],
+                ))
+        scenarios.append(self.measure(
+            {"name": "concurrent_upload", "files": options[CONCURRENT_FILES], "size": options[CONCURRENT_SIZE],
+             "concurrency": options[CONCURRENCY]},
+            [lambda: self.prepare_upload(options[CONCURRENT_FILES], options[CONCURRENT_SIZE])
+             for _ in range(options[CONCURRENCY] * options[REPETITIONS])],
+            concurrency=options[CONCURRENCY],
+        ))
+        if options[LARGE_SIZE]:
+            file_upload_ids = []
+
+            def prepare_large_upload():
+                send = self.prepare_upload(1, options[LARGE_SIZE])
+
+                def send_and_keep_id():
+                    response, transferred = send()
+                    file_upload_ids.append(response.data[0]["id"])
+                    return response, transferred
+                return send_and_keep_id
+
+            scenarios.append(self.measure({"name": "large_upload", "files": 1, "size": options[LARGE_SIZE]},
+                                          [prepare_large_upload]))
+            file_upload_id = file_upload_ids[0]
+            scenarios.append(self.measure(
+                {"name": "full_download", "size": options[LARGE_SIZE]},
+                [lambda: self.prepare_download(file_upload_id) for _ in range(options[REPETITIONS])],
+            ))
+            ranges = []
+            for _ in range(options[REPETITIONS] * 10):
+                start = self.random.randrange(max(1, options[LARGE_SIZE] - options[RANGE_SIZE]))
+                ranges.append(f"bytes={start}-{start + options[RANGE_SIZE] - 1}")
+            scenarios.append(self.measure(
+                {"name": "range_download", "size": options[RANGE_SIZE]},
+                [lambda r=r: self.prepare_download(file_upload_id, HTTP_RANGE=r) for r in ranges],
+            ))
+        return scenarios
+
+    # The prepare_* methods build a request (e.g. generate and encode the files) and return a function that sends it to
+    # the view and returns the response and the number of transferred bytes, so that only the view is measured.
+
+    def prepare_upload(self, count, size):
+        files = [SimpleUploadedFile(f"file_{i}.bin", self.random.randbytes(size)) for i in range(count)]
+        request = self.factory.post("/", {"files": files}, format="multipart")
+        force_authenticate(request, self.user)
+
+        def send():
+            response = self.file_upload_batch_viewset_class.as_view({"post": "create"})(request)
+            # Closes the uploaded files, which the request handler would do after the response.
+            request.close()
+            if response.status_code != 201:
+                raise AssertionError(f"Upload failed with {response.status_code}: {response.data}")
+            return response, count * size
+        return send
+
+    def prepare_download(self, file_upload_id, **headers):
+        request = self.factory.get("/", **headers)
+        force_authenticate(request, self.user)
+
+        def send():
+            response = self.file_upload_viewset_class.as_view({"get": "download"})(request, pk=file_upload_id)
+            if response.status_code not in (200, 206):
+                raise AssertionError(f"Download failed with {response.status_code}")
+            transferred = sum(len(chunk) for chunk in response) if response.streaming else len(response.content)
+            response.close()
+            return response, transferred
+        return send
+
+    def measure(self, scenario, requests, concurrency=1):
+        """
+        Sends the requests in rounds of the concurrency. The requests of a round are prepared before it starts, so that
+        neither the time nor the memory of their preparation is measured.
+        """
+        def call(send):
+            try:
+                with CaptureQueriesContext(connections["default"]) as queries:
+                    start = time.perf_counter()
+                    _, transferred = send()
+                    latency = time.perf_counter() - start
+                return latency, transferred, len(queries)
+            finally:
+                if concurrency > 1:
+                    connections.close_all()
+
+        measurements = []
+        seconds = 0
+        peak_rss_increase = None
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for i in range(0, len(requests), concurrency):
+                sends = [prepare() for prepare in requests[i:i + concurrency]]
+                rss = _reset_peak_rss()
+                start = time.perf_counter()
+                measurements.extend(pool.map(call, sends) if concurrency > 1 else map(call, sends))
+                seconds += time.perf_counter() - start
+                if rss is not None:
+                    peak_rss_increase = max(peak_rss_increase or 0, _read_status("VmHWM") - rss)
+                del sends
+        latencies = [latency for latency, _, _ in measurements]
+        transferred = sum(t for _, t, _ in measurements)
+        statements = [s for _, _, s in measurements]
+        result = dict(
+            scenario,
+            requests=len(measurements),
+            bytes=transferred,
+            seconds=seconds,
+            mb_per_second=transferred / 1048576 / seconds if seconds else None,
+            latency_p50=_percentile(latencies, 50),
+            latency_p99=_percentile(latencies, 99),
+            statements_per_request=_percentile(statements, 50),
+            peak_rss_increase_bytes=peak_rss_increase,
+        )
+        print("Measured:", json.dumps(scenario), file=sys.stderr)
+        return result
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from django_common.postgresql import listen, wait_for_notification
+from django_fileupload.models import DELETION_CHANNEL, FileUpload, FileUploadBatch
+
+POLL_INTERVAL = "poll_interval"
+ONCE = "once"
+CHUNK_SIZE = "chunk_size"
+FILE_RATE = "file_rate"
+
+
+class Command(BaseCommand):
+    """
+    Deletes the file uploads and the files of the file upload batches that are marked as deleted (see the bulk_delete
+    action and the file_upload_batch_delete management command), and then the batches.
+    The records are deleted in chunks, each in a short transaction, to avoid long locks and large transactions. The
+    files of a chunk are removed after its transaction is committed (a file whose removal is interrupted is found by
+    the garbage collector).
+    Several processes can run in parallel as the records of each chunk are locked and skipped by the others.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--%s" % POLL_INTERVAL, required=False, default=60, type=int,
+                            help="Check for deleted file upload batches after this number of seconds without "
+                                 "notification.")
+        parser.add_argument("--%s" % ONCE, action="store_true",
+                            help="Delete the file upload batches that are marked as deleted and exit.")
+        parser.add_argument("--%s" % CHUNK_SIZE, required=False, default=1000, type=int,
+                            help="The number of records that are deleted per transaction.")
+        parser.add_argument("--%s" % FILE_RATE, required=False, default=100, type=int,
+                            help="Remove at most this number of files per second (0 for no limit).")
+
+    def delete_file_uploads(self, options):
+        with transaction.atomic():
+            file_uploads = list(FileUpload.objects.select_for_update(skip_locked=True, of=("self",)).filter(
+                file_upload_batch__deleted_on__isnull=False
+            ).order_by("id")[:options[CHUNK_SIZE]])
+            if not file_uploads:
+                return False
+            FileUpload.bulk_delete(file_uploads)
+        next_time = time.monotonic()
+        for file_upload in file_uploads:
+            if options[FILE_RATE]:
+                now = time.monotonic()
+                if next_time > now:
+                    time.sleep(next_time - now)
+                next_time = max(now, next_time) + 1 / options[FILE_RATE]
+            file_upload.discard_file()
+        print("Deleted", len(file_uploads), "file uploads")
+        return True
+
+    def delete_file_upload_batches(self, options):
+        with transaction.atomic():
+            # The batches whose file uploads are still locked by another process are deleted by a later chunk.
+            ids = list(FileUploadBatch.objects.select_for_update(skip_locked=True, of=("self",)).filter(
+                deleted_on__isnull=False, file_uploads__isnull=True
+            ).order_by("id").values_list("id", flat=True)[:options[CHUNK_SIZE]])
+            if not ids:
+                return False
+            FileUploadBatch.objects.filter(pk__in=ids).delete()
+        print("Deleted", len(ids), "file upload batches")
+        return True
+
+    def handle(self, *args, **options):
+        if not options[ONCE]:
+            listen(DELETION_CHANNEL)
+        while True:
+            while self.delete_file_uploads(options) or self.delete_file_upload_batches(options):
+                pass
+            if options[ONCE]:
+                break
+            wait_for_notification(options[POLL_INTERVAL])
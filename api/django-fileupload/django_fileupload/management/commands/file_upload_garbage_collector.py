@@ -1,53 +1,154 @@
+import heapq
 import os
 import shutil
+import time
 
 from django.core.management import BaseCommand
+from django.db import transaction
 
-from django_fileupload.models import FileUpload
+from django_fileupload.models import (STAGING_DIRECTORY, FileUpload, FileUploadBlob, FileUploadSession,
+                                      generate_file_path)
+from django_fileupload.uploadhandlers import get_spool_directory
 
 FILE_UPLOAD_DIRECTORY = "file_upload_directory"
 FILE_UPLOAD_GARBAGE_DIRECTORY = "file_upload_garbage_directory"
+# Files are stored before their records are committed (see FileUploadBatchViewSet.insert_file_uploads(...)), so recently
+# modified directories are not considered as zombies.
+GRACE_PERIOD = "grace_period"
+DRY_RUN = "dry_run"
+CHUNK_SIZE = 10000
+PROGRESS_INTERVAL = 1000000
+# Directories with larger names are not file upload directories (and would need a huge bitmap).
+MAXIMUM_ID = 2 ** 40
+
+
+class _IdBitmap:
+    """A compact set of the (dense, positive) ids of the file uploads that iterates in ascending order."""
+
+    def __init__(self):
+        self.bits = bytearray()
+
+    def add(self, file_upload_id):
+        index = file_upload_id >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(max(index + 1 - len(self.bits), len(self.bits))))
+        self.bits[index] |= 1 << (file_upload_id & 7)
+
+    def __iter__(self):
+        for index, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield index << 3 | bit
+
+
+def _with_parent_directory(parent_directory, ids):
+    for file_upload_id in ids:
+        yield file_upload_id, parent_directory
 
 
 class Command(BaseCommand):
 
     def add_arguments(self, parser):
-        parser.add_argument("--%s" % FILE_UPLOAD_DIRECTORY, required=True, type=str)
+        parser.add_argument("--%s" % FILE_UPLOAD_DIRECTORY, required=False, type=str,
+                            help="Without it (e.g. for an object storage), only the unreferenced blobs are removed.")
         parser.add_argument("--%s" % FILE_UPLOAD_GARBAGE_DIRECTORY, required=False, type=str)
+        parser.add_argument("--%s" % GRACE_PERIOD, required=False, type=int, default=60, help="In minutes.")
+        parser.add_argument("--%s" % DRY_RUN, action="store_true", help="Only reports the zombies.")
 
-    def find(self, absolute_directory, directory, *applies):
-        for test in os.listdir(absolute_directory):
-            absolute_test = os.path.join(absolute_directory, test)
-            if os.path.isdir(absolute_test):
-                self.find(absolute_test, test, *applies)
-                continue
-            for apply in applies:
-                apply(absolute_directory, directory)
+    def find(self, absolute_directory):
+        """
+        Walks the tree iteratively and collects the ids of the file upload directories (i.e. of the directories that
+        contain files within the directories of the file uploads, see generate_file_path(...)) as compact sets per
+        parent directory. The blobs, the upload sessions, the spool and the staging directory are skipped.
+        """
+        file_upload_path = generate_file_path(FileUpload())
+        skipped_names = {FileUploadBlob.__name__, generate_file_path(FileUploadSession()), ".spool", STAGING_DIRECTORY}
+        skipped_directories = {os.path.realpath(get_spool_directory())}
+        ids = {}
+        count = 0
+        stack = [absolute_directory]
+        while stack:
+            absolute_test_directory = stack.pop()
+            contains_files = False
+            with os.scandir(absolute_test_directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in skipped_names and os.path.realpath(entry.path) not in skipped_directories:
+                            stack.append(entry.path)
+                    else:
+                        contains_files = True
+            if contains_files:
+                parent_directory, file_upload_directory = os.path.split(absolute_test_directory)
+                if (os.path.basename(parent_directory) != file_upload_path or not file_upload_directory.isdigit()
+                        or int(file_upload_directory) >= MAXIMUM_ID):
+                    print("Unexpected directory:", absolute_test_directory)
+                    continue
+                ids.setdefault(parent_directory, _IdBitmap()).add(int(file_upload_directory))
+                count += 1
+                if count % PROGRESS_INTERVAL == 0:
+                    print("Found", count, "file upload directories")
+        print("Found", count, "file upload directories")
+        return ids
 
     def handle(self, *args, **options):
-        queryset = FileUpload.objects
-
-        def test_for_database_zombie(absolute_file_upload_directory, file_upload_directory):
-            nonlocal queryset
-            queryset = queryset.exclude(id=file_upload_directory)
-
-        def test_for_filesystem_zombie(absolute_file_upload_directory, file_upload_directory):
-            try:
-                FileUpload.objects.get(pk=file_upload_directory)
-            except FileUpload.DoesNotExist:
-                print("Filesystem zombie:", absolute_file_upload_directory)
-                relative_file_upload_directory = os.path.relpath(absolute_file_upload_directory,
-                                                                 options[FILE_UPLOAD_DIRECTORY])
-                if options[FILE_UPLOAD_GARBAGE_DIRECTORY]:
-                    absolute_file_upload_garbage_directory = os.path.join(options[FILE_UPLOAD_GARBAGE_DIRECTORY],
-                                                                          os.path.split(relative_file_upload_directory)[0])
-                    os.makedirs(absolute_file_upload_garbage_directory, exist_ok=True)
-                    print("Move", absolute_file_upload_directory, "to the garbage directory",
-                          absolute_file_upload_garbage_directory)
-                    shutil.move(absolute_file_upload_directory, absolute_file_upload_garbage_directory)
-
-        self.find(options[FILE_UPLOAD_DIRECTORY], None, test_for_database_zombie,
-                  test_for_filesystem_zombie)
-
-        for file_upload in queryset.all():
-            print("Database zombie:", file_upload)
+        dry_run = options[DRY_RUN]
+        grace_period_start = time.time() - options[GRACE_PERIOD] * 60
+
+        def move_filesystem_zombie(absolute_file_upload_directory):
+            if os.path.getmtime(absolute_file_upload_directory) > grace_period_start:
+                return
+            print("Filesystem zombie:", absolute_file_upload_directory)
+            relative_file_upload_directory = os.path.relpath(absolute_file_upload_directory,
+                                                             options[FILE_UPLOAD_DIRECTORY])
+            if options[FILE_UPLOAD_GARBAGE_DIRECTORY] and not dry_run:
+                absolute_file_upload_garbage_directory = os.path.join(options[FILE_UPLOAD_GARBAGE_DIRECTORY],
+                                                                      os.path.split(relative_file_upload_directory)[0])
+                os.makedirs(absolute_file_upload_garbage_directory, exist_ok=True)
+                print("Move", absolute_file_upload_directory, "to the garbage directory",
+                      absolute_file_upload_garbage_directory)
+                shutil.move(absolute_file_upload_directory, absolute_file_upload_garbage_directory)
+
+        if options[FILE_UPLOAD_DIRECTORY]:
+            self.compare(options, move_filesystem_zombie)
+            # Files whose upload failed before they were moved from the staging directory (e.g. the process died).
+            absolute_staging_directory = os.path.join(options[FILE_UPLOAD_DIRECTORY], STAGING_DIRECTORY)
+            if os.path.isdir(absolute_staging_directory):
+                with os.scandir(absolute_staging_directory) as entries:
+                    for entry in entries:
+                        move_filesystem_zombie(entry.path)
+
+        # Blobs of deduplicated files that are not referenced anymore.
+        for file_upload_blob in FileUploadBlob.objects.filter(reference_count=0).iterator():
+            with transaction.atomic():
+                if FileUploadBlob.objects.select_for_update().filter(pk=file_upload_blob.pk,
+                                                                     reference_count=0).exists():
+                    print("Remove unreferenced blob:", file_upload_blob.name)
+                    if not dry_run:
+                        file_upload_blob.remove()
+
+    def compare(self, options, move_filesystem_zombie):
+        # Both the directories and the records are sorted by their ids, so the zombies are found with a single merge.
+        directories = heapq.merge(*(
+            _with_parent_directory(parent_directory, parent_directory_ids)
+            for parent_directory, parent_directory_ids in self.find(options[FILE_UPLOAD_DIRECTORY]).items()
+        ))
+        records = FileUpload.objects.order_by("id").values_list("id", "file").iterator(chunk_size=CHUNK_SIZE)
+        storage = FileUpload.file.field.storage
+        directory = next(directories, None)
+        record = next(records, None)
+        count = 0
+        while directory is not None or record is not None:
+            if record is None or directory is not None and directory[0] < record[0]:
+                move_filesystem_zombie(os.path.join(directory[1], str(directory[0])))
+                directory = next(directories, None)
+                continue
+            if directory is None or record[0] < directory[0]:
+                print("Database zombie:", storage.path(record[1]))
+            else:
+                directory = next(directories, None)
+            record = next(records, None)
+            count += 1
+            if count % PROGRESS_INTERVAL == 0:
+                print("Compared", count, "file uploads")
+        print("Compared", count, "file uploads")
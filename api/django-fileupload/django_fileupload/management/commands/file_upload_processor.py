@@ -0,0 +1,65 @@
+import traceback
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from django_common.postgresql import listen, wait_for_notification
+from django_fileupload.models import PROCESSING_CHANNEL, FileUpload, FileUploadBatch, FileUploadStatus
+
+POLL_INTERVAL = "poll_interval"
+ONCE = "once"
+
+
+class Command(BaseCommand):
+    """
+    Processes the pending file uploads (see DJANGO_FILEUPLOAD_ASYNCHRONOUS_PROCESSING).
+    Several processes can run in parallel as each file upload is locked while it is processed and skipped by the others.
+    Projects can subclass the command and override process(...) to add their validation and derived metadata, and
+    verify_file_checksum(...) to verify the checksums that were not known when the files were uploaded (the others are
+    verified by the verify_file_checksum(...) method of the FileUploadBatchViewSet).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--%s" % POLL_INTERVAL, required=False, default=60, type=int,
+                            help="Check for pending file uploads after this number of seconds without notification.")
+        parser.add_argument("--%s" % ONCE, action="store_true",
+                            help="Process the pending file uploads and exit.")
+
+    def verify_file_checksum(self, file_upload, file_checksum):
+        return True
+
+    def process(self, file_upload):
+        """Processes a file upload, an exception marks it as failed."""
+        def verify_checksum(file_checksum):
+            if not self.verify_file_checksum(file_upload, file_checksum):
+                raise ValueError("Incorrect checksum.")
+
+        file_upload.process(verify_checksum)
+
+    def process_next(self):
+        with transaction.atomic():
+            file_upload = FileUpload.objects.select_for_update(skip_locked=True).filter(
+                status=FileUploadStatus.PENDING
+            ).order_by("id").first()
+            if file_upload is None:
+                return False
+            try:
+                with transaction.atomic():
+                    self.process(file_upload)
+                print("Processed:", file_upload)
+            except Exception as e:
+                traceback.print_exc()
+                FileUpload.objects.filter(pk=file_upload.pk).update(status=FileUploadStatus.FAILED,
+                                                                    processing_error=str(e))
+                FileUploadBatch.summarize_processed_file_uploads(file_upload.file_upload_batch_id)
+        return True
+
+    def handle(self, *args, **options):
+        if not options[ONCE]:
+            listen(PROCESSING_CHANNEL)
+        while True:
+            while self.process_next():
+                pass
+            if options[ONCE]:
+                break
+            wait_for_notification(options[POLL_INTERVAL])
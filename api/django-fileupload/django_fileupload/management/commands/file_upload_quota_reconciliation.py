@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from django_fileupload.models import FileUploadBatch, FileUploadQuota
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the counters of the storage quotas from the file uploads, e.g. after they were uploaded before the counters
+    were maintained.
+    """
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Locking the quotas defers the counter updates of concurrent insertions and deletions, which are then added
+            # to the rebuilt counters.
+            quotas = {quota.owner_id: quota for quota in FileUploadQuota.objects.select_for_update()}
+            for quota in quotas.values():
+                quota.used_size = 0
+                quota.used_count = 0
+            for owner_id, used_size, used_count in FileUploadBatch.objects.values("owner_id").annotate(
+                    used_size=Sum("file_uploads__original_size"), used_count=Count("file_uploads")
+            ).values_list("owner_id", "used_size", "used_count"):
+                quota = quotas.setdefault(owner_id, FileUploadQuota(owner_id=owner_id))
+                quota.used_size += used_size or 0
+                quota.used_count += used_count
+            FileUploadQuota.objects.bulk_create(
+                quotas.values(),
+                update_conflicts=True,
+                unique_fields=("owner",),
+                update_fields=("used_size", "used_count"),
+            )
+        print("Rebuilt the counters of", len(quotas), "quotas")
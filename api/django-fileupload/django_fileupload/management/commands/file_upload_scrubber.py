@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from python_utilities.crypto import FILE_READ_BUFFER_SIZE, generate_checksum_from_chunks
+
+from django_common.postgresql import allocation_horizon
+from django_fileupload.compression import open_decompressed
+from django_fileupload.models import FileUpload
+
+CHECKPOINT_FILE = "checkpoint_file"
+REPORT_FILE = "report_file"
+TIME_BUDGET = "time_budget"
+BANDWIDTH = "bandwidth"
+WORKERS = "workers"
+CHUNK_SIZE = 1000
+
+
+class _Throttle:
+    """Limits the bytes per second that are read by all threads together."""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def consume(self, size):
+        if not self.bytes_per_second:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + size / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+class Command(BaseCommand):
+    """
+    Re-hashes the stored files and compares the checksums with the ones calculated when they were uploaded.
+    Each run continues after the last file upload that was scrubbed by the previous run (see the checkpoint file) and
+    starts again from the beginning when all file uploads were scrubbed.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--%s" % CHECKPOINT_FILE, required=True, type=str,
+                            help="JSON file with the id of the last scrubbed file upload.")
+        parser.add_argument("--%s" % REPORT_FILE, required=False, type=str,
+                            help="JSON Lines file to which the mismatches are appended (default: standard output).")
+        parser.add_argument("--%s" % TIME_BUDGET, required=False, default=0, type=int,
+                            help="Stop after this number of minutes (0 for no limit).")
+        parser.add_argument("--%s" % BANDWIDTH, required=False, default=50, type=int,
+                            help="Read at most this number of megabytes per second (0 for no limit).")
+        parser.add_argument("--%s" % WORKERS, required=False, default=4, type=int)
+
+    def handle(self, *args, **options):
+        deadline = time.monotonic() + options[TIME_BUDGET] * 60 if options[TIME_BUDGET] else None
+        throttle = _Throttle(options[BANDWIDTH] * 1048576)
+        storage = FileUpload.file.field.storage
+
+        last_id = 0
+        if os.path.exists(options[CHECKPOINT_FILE]):
+            with open(options[CHECKPOINT_FILE]) as f:
+                last_id = json.load(f)["last_id"]
+
+        def save_checkpoint():
+            with open(options[CHECKPOINT_FILE] + ".tmp", "w") as f:
+                json.dump({"last_id": last_id}, f)
+            os.replace(options[CHECKPOINT_FILE] + ".tmp", options[CHECKPOINT_FILE])
+
+        def read(file):
+            with file:
+                while True:
+                    data = file.read(FILE_READ_BUFFER_SIZE)
+                    if not data:
+                        break
+                    throttle.consume(len(data))
+                    yield data
+
+        def scrub(file_upload):
+            """Returns None if the time budget is exhausted, else a (possibly empty) report."""
+            file_upload_id, file_name, checksum, content_encoding = file_upload
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            report = {"id": file_upload_id, "file": file_name, "checksum": checksum}
+            try:
+                actual_checksum = generate_checksum_from_chunks(
+                    read(open_decompressed(storage.open(file_name, "rb"), content_encoding)))
+            except FileNotFoundError:
+                return dict(report, error="missing")
+            except OSError as e:
+                return dict(report, error=str(e))
+            if actual_checksum != checksum:
+                return dict(report, error="mismatch", actual_checksum=actual_checksum)
+            return {}
+
+        report_file = open(options[REPORT_FILE], "a") if options[REPORT_FILE] else None
+        count = 0
+        mismatches = 0
+        try:
+            with ThreadPoolExecutor(max_workers=options[WORKERS]) as pool:
+                while True:
+                    file_uploads = FileUpload.objects.filter(id__gt=last_id).exclude(checksum="")
+                    # The checkpoint must not pass the ids of uploads in progress, whose file uploads would be skipped.
+                    horizon = allocation_horizon(FileUpload)
+                    if horizon is not None:
+                        file_uploads = file_uploads.filter(id__lt=horizon)
+                    file_uploads = list(file_uploads.order_by("id").values_list(
+                        "id", "file", "checksum", "content_encoding"
+                    )[:CHUNK_SIZE])
+                    if not file_uploads:
+                        if horizon is not None:
+                            # The next run continues when the uploads in progress are inserted.
+                            print("Stopped at the file uploads in progress from id", horizon, file=sys.stderr)
+                            break
+                        # All file uploads were scrubbed, the next run starts a new pass.
+                        last_id = 0
+                        print("Finished a pass over all file uploads", file=sys.stderr)
+                        break
+                    # The results are collected in the order of the ids, so the checkpoint only covers the file
+                    # uploads that were scrubbed.
+                    for file_upload, report in zip(file_uploads, pool.map(scrub, file_uploads)):
+                        if report is None:
+                            break
+                        if report:
+                            mismatches += 1
+                            # The reports are the only output on the standard output (without a report file), the
+                            # progress is written to the standard error.
+                            print(json.dumps(report), file=report_file or sys.stdout, flush=True)
+                        last_id = file_upload[0]
+                        count += 1
+                    else:
+                        save_checkpoint()
+                        print("Scrubbed", count, "file uploads up to id", last_id, file=sys.stderr)
+                        continue
+                    print("Time budget exhausted", file=sys.stderr)
+                    break
+        finally:
+            save_checkpoint()
+            if report_file is not None:
+                report_file.close()
+        print("Scrubbed", count, "file uploads,", mismatches, "mismatches", file=sys.stderr)
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from django_fileupload.models import FileUploadSession
+
+MAXIMUM_AGE = "maximum_age"
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument("--%s" % MAXIMUM_AGE, required=False, default=168, type=int,
+                            help="Discard upload sessions that are older than this number of hours.")
+
+    def handle(self, *args, **options):
+        for file_upload_session in FileUploadSession.objects.filter(
+                created_on__lt=timezone.now() - timedelta(hours=options[MAXIMUM_AGE])
+        ).iterator():
+            print("Discard upload session:", file_upload_session)
+            file_upload_session.discard()
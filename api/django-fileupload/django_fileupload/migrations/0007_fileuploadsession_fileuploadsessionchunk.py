@@ -0,0 +1,45 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0006_rename_mime_type_fileupload_detected_mime_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileUploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('checksum', models.CharField(blank=True, max_length=64)),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='FileUploadSessionChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.PositiveBigIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('checksum', models.CharField(max_length=64)),
+                ('file_upload_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='django_fileupload.fileuploadsession')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='fileuploadsessionchunk',
+            constraint=models.UniqueConstraint(fields=('file_upload_session', 'offset'), name='unique__offset_in_a_file_upload_session'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0007_fileuploadsession_fileuploadsessionchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileUploadBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checksum', models.CharField(max_length=64, unique=True)),
+                ('reference_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0008_fileuploadblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='content_encoding',
+            field=models.CharField(blank=True, default='', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='original_size',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileuploadblob',
+            name='content_encoding',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='fileuploadblob',
+            name='checksum',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='fileuploadblob',
+            constraint=models.UniqueConstraint(fields=('checksum', 'content_encoding'), name='unique__checksum_and_content_encoding_of_a_file_upload_blob'),
+        ),
+    ]
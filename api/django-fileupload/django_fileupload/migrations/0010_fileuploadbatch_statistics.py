@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0009_fileupload_compression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileuploadbatch',
+            name='file_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fileuploadbatch',
+            name='file_names',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fileuploadbatch',
+            name='total_size',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0010_fileuploadbatch_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='processing_error',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('failed', 'Failed')], default='processed', editable=False, max_length=9),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:29
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The index is created without blocking the writes to the table, which cannot happen in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('django_fileupload', '0011_fileupload_status'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='fileupload',
+            index=models.Index(fields=['checksum'], name='fileupload_checksum_index'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0012_fileupload_checksum_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileUploadQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('used_size', models.PositiveBigIntegerField(default=0)),
+                ('used_count', models.PositiveIntegerField(default=0)),
+                ('limit_size', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('limit_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='file_upload_quota', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:36
+
+import django_fileupload.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0013_fileuploadquota'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fileupload',
+            name='file',
+            field=models.FileField(storage=django_fileupload.models.get_file_upload_storage, upload_to=django_fileupload.models._generate_complete_file_path),
+        ),
+    ]
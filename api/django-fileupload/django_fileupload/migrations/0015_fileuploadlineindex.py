@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0014_fileupload_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileUploadLineIndex',
+            fields=[
+                ('file_upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='line_index', serialize=False, to='django_fileupload.fileupload')),
+                ('interval', models.PositiveIntegerField()),
+                ('line_count', models.PositiveBigIntegerField()),
+                ('offsets', models.BinaryField()),
+            ],
+        ),
+    ]
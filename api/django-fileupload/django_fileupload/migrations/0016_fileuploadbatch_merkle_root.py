@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0015_fileuploadlineindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileuploadbatch',
+            name='merkle_root',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
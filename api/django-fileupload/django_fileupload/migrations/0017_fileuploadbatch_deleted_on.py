@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_fileupload', '0016_fileuploadbatch_merkle_root'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileuploadbatch',
+            name='deleted_on',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -1,32 +1,316 @@
+import hashlib
 import os
-from os.path import basename, join
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import Counter
+from contextlib import ExitStack, suppress
+from os import environ
+from os.path import basename, dirname, join
 
-import magic
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
 from django.core.files.storage import FileSystemStorage
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete
 from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 
-from django_common.models import OwnedModel
-from python_utilities.crypto import generate_checksum_from_file
+from django_common.models import EnhancedTextChoices, OwnedModel
+from django_common.postgresql import advisory_transaction_lock, in_flight_ids, notify
+from python_utilities.crypto import (FILE_READ_BUFFER_SIZE, generate_checksum_from_chunks, generate_checksum_from_file,
+                                     generate_merkle_leaf, generate_merkle_root)
+
+from django_fileupload.compression import COMPRESSION, GzipCompressedFile, open_decompressed
+from django_fileupload.lineindex import LINE_INDEX_INTERVAL, NEWLINE, LineIndexBuilder, pack_offsets, unpack_offset
+from django_fileupload.uploadhandlers import (MIME_TYPE_DETECTION_BUFFER_SIZE, detect_mime_type_from_buffer,
+                                              detect_mime_type_from_file, get_spool_directory)
+
+# Stores the content of identical files only once (see FileUploadBlob).
+DEDUPLICATION = environ.get("DJANGO_FILEUPLOAD_DEDUPLICATION", "False") == "True"
+# Calculates the checksums and the MIME types of the file uploads in the file_upload_processor management command
+# instead of the upload request (see FileUploadStatus).
+ASYNCHRONOUS_PROCESSING = environ.get("DJANGO_FILEUPLOAD_ASYNCHRONOUS_PROCESSING", "False") == "True"
+# The default maximum number of bytes and files that an owner can store (0 for no limit, see FileUploadQuota).
+QUOTA_SIZE = int(environ.get("DJANGO_FILEUPLOAD_QUOTA_SIZE", 0))
+QUOTA_COUNT = int(environ.get("DJANGO_FILEUPLOAD_QUOTA_COUNT", 0))
+# The storage of the files, "object" for an S3-compatible object storage (see objectstorage.py) or empty for the
+# filesystem (MEDIA_ROOT).
+STORAGE = environ.get("DJANGO_FILEUPLOAD_STORAGE", "")
+if DEDUPLICATION and STORAGE == "object":
+    # An object storage has no hardlinks, so the file of every duplicate would be a copy of its blob on the server.
+    raise ImproperlyConfigured("DJANGO_FILEUPLOAD_DEDUPLICATION is not supported with the object storage.")
+# The directory of the storage in which the files are stored until their ids are allocated (see
+# FileUpload.store_file()).
+STAGING_DIRECTORY = ".staging"
+# The channels of the PostgreSQL notifications that wake up the file_upload_processor and the file_upload_deleter
+# management commands.
+PROCESSING_CHANNEL = "django_fileupload_processing"
+DELETION_CHANNEL = "django_fileupload_deletion"
 
 
 class FileUploadBatch(OwnedModel):
     uploaded_on = models.DateTimeField(default=timezone.now)
+    # Statistics of the file uploads of the batch, which are maintained when file uploads are inserted or deleted (see
+    # the file_upload_batch_statistics management command for batches that were uploaded before).
+    file_count = models.PositiveIntegerField(default=0, editable=False)
+    total_size = models.PositiveBigIntegerField(default=0, editable=False)
+    file_names = models.JSONField(default=list, editable=False)
+    # The root of a Merkle tree over the (position, checksum, size) of the file uploads in the order of their positions
+    # (see python_utilities.crypto), so that copies of a batch are verified or compared with a few hashes.
+    merkle_root = models.CharField(max_length=64, blank=True, editable=False)
+    # A batch that is marked as deleted is hidden, and its file uploads and files are deleted in the background by the
+    # file_upload_deleter management command.
+    deleted_on = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
 
     def __str__(self):
-        file_uploads_list = ", ".join(
-            [os.path.basename(f.file.name) for f in FileUpload.objects.filter(
-                file_upload_batch_id=self.id
-            ).all()]
+        return f"Batch {self.id} ({', '.join(self.file_names)})"
+
+    @classmethod
+    def mark_deleted(cls, queryset):
+        """Marks the batches of a queryset as deleted with a single statement and returns their number."""
+        count = queryset.filter(deleted_on__isnull=True).update(deleted_on=timezone.now())
+        if count:
+            transaction.on_commit(lambda: notify(DELETION_CHANNEL))
+        return count
+
+    @staticmethod
+    def generate_merkle_leaves(file_uploads):
+        """Calculates the leaf hashes of the (position, checksum, size) of file uploads ordered by their positions."""
+        return [generate_merkle_leaf(position, checksum, size or 0) for position, checksum, size in file_uploads]
+
+    @classmethod
+    def summarize_file_uploads(cls, file_upload_batch_id):
+        """Returns the names and the Merkle root of the file uploads of a batch."""
+        file_uploads = FileUpload.objects.filter(file_upload_batch_id=file_upload_batch_id).order_by(
+            "position"
+        ).values_list("file", "position", "checksum", "original_size")
+        return {
+            "file_names": [basename(file_name) for file_name, *_ in file_uploads],
+            "merkle_root": generate_merkle_root(cls.generate_merkle_leaves(leaf for _, *leaf in file_uploads)),
+        }
+
+    @classmethod
+    def summarize_processed_file_uploads(cls, file_upload_batch_id):
+        """
+        Updates the names and the Merkle root of a batch once none of its file uploads is pending anymore, i.e. once per
+        batch instead of once per processed file upload.
+        """
+        # The processors of the last pending file uploads of a batch wait for each other, so that the last one to commit
+        # sees the others as processed.
+        with advisory_transaction_lock(cls, file_upload_batch_id):
+            if not FileUpload.objects.filter(file_upload_batch_id=file_upload_batch_id,
+                                             status=FileUploadStatus.PENDING).exists():
+                cls.objects.filter(pk=file_upload_batch_id).update(**cls.summarize_file_uploads(file_upload_batch_id))
+
+    @classmethod
+    def count_file_uploads(cls, file_upload_batch_id, count, size, summarize=True):
+        """
+        Adds the number and the size of inserted (or, if negative, deleted) file uploads to the statistics of a batch.
+        """
+        cls.objects.filter(pk=file_upload_batch_id).update(
+            # The statistics of batches that were uploaded before they were maintained are only complete after the
+            # backfill, and must not become negative before.
+            file_count=Greatest(models.F("file_count") + count, 0),
+            total_size=Greatest(models.F("total_size") + size, 0),
+            **(cls.summarize_file_uploads(file_upload_batch_id) if summarize else {}),
         )
-        return f"Batch {self.id} ({file_uploads_list})"
+        FileUploadQuota.count_file_uploads(file_upload_batch_id, count, size)
+
+
+class FileUploadQuota(models.Model):
+    """
+    Model to track the storage that is used by the file uploads of an owner and to limit it.
+    The counters are maintained in the same transaction as the insertions and deletions of file uploads (see the
+    file_upload_quota_reconciliation management command to rebuild them).
+    """
+    owner = models.OneToOneField(get_user_model(), related_name="file_upload_quota", on_delete=models.CASCADE)
+    used_size = models.PositiveBigIntegerField(default=0)
+    used_count = models.PositiveIntegerField(default=0)
+    # Override the default limits (see QUOTA_SIZE and QUOTA_COUNT).
+    limit_size = models.PositiveBigIntegerField(null=True, blank=True)
+    limit_count = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Quota of {self.owner} ({self.used_size} bytes, {self.used_count} files)"
+
+    @classmethod
+    def count_file_uploads(cls, file_upload_batch_id, count, size):
+        """
+        Adds the number and the size of inserted (or, if negative, deleted) file uploads of a batch to the counters of
+        its owner.
+        """
+        owner_id = FileUploadBatch.objects.filter(pk=file_upload_batch_id).values("owner_id")
+        counters = {
+            "used_size": Greatest(models.F("used_size") + size, 0),
+            "used_count": Greatest(models.F("used_count") + count, 0),
+        }
+        if not cls.objects.filter(owner_id=models.Subquery(owner_id)).update(**counters) and count > 0:
+            owner_id = owner_id.values_list("owner_id", flat=True).first()
+            if owner_id is not None:
+                cls.objects.get_or_create(owner_id=owner_id)
+                cls.objects.filter(owner_id=owner_id).update(**counters)
+
+    @classmethod
+    def exceeds(cls, owner_id, size, count, lock=True):
+        """
+        Checks if more file uploads would exceed the quota of an owner. If locked, the counters of the owner cannot
+        change until the end of the transaction, i.e. until the file uploads are inserted.
+        """
+        with transaction.atomic():
+            if lock:
+                # The row must exist to be locked, or concurrent first uploads of an owner would not be serialized.
+                cls.objects.get_or_create(owner_id=owner_id)
+                quota = cls.objects.select_for_update().get(owner_id=owner_id)
+            else:
+                try:
+                    quota = cls.objects.get(owner_id=owner_id)
+                except cls.DoesNotExist:
+                    quota = cls(owner_id=owner_id)
+            limit_size = quota.limit_size if quota.limit_size is not None else QUOTA_SIZE
+            limit_count = quota.limit_count if quota.limit_count is not None else QUOTA_COUNT
+            return bool(
+                limit_size and quota.used_size + size > limit_size
+                or limit_count and quota.used_count + count > limit_count
+            )
 
 
 class FileUploadFileStorage(FileSystemStorage):
+    """
+    Files which provide a temporary file path (e.g. uploads spooled by the SpoolTemporaryFileUploadHandler and
+    complete file upload sessions) are moved into the storage with a rename if they are on the same filesystem,
+    and only copied otherwise.
+    Files are linked (e.g. to a blob of the same content if deduplication is enabled, see FileUploadBlob) with a
+    hardlink instead of a copy, and moved (e.g. from the staging directory, see FileUpload.promote_file()) with a
+    rename.
+    """
 
     def get_alternative_name(self, file_root, file_ext):
         raise FileExistsError
 
+    def link(self, source_name, name):
+        """Stores the content of a stored file under another name, as a copy if the filesystem has no hardlinks."""
+        source_path = self.path(source_name)
+        path = self.path(name)
+        os.makedirs(dirname(path), exist_ok=True)
+        try:
+            os.link(source_path, path)
+        except (FileNotFoundError, FileExistsError):
+            raise
+        except OSError:
+            shutil.copyfile(source_path, path)
+
+    def move(self, source_name, name):
+        """Renames a stored file, removes the directory it leaves empty and returns the new name."""
+        source_path = self.path(source_name)
+        path = self.path(name)
+        os.makedirs(dirname(path), exist_ok=True)
+        os.rename(source_path, path)
+        with suppress(OSError):
+            os.rmdir(dirname(source_path))
+        return name
+
+
+def get_file_upload_storage():
+    """Returns the storage of the file uploads (see STORAGE)."""
+    if STORAGE == "object":
+        from django_fileupload.objectstorage import ObjectFileUploadStorage
+        return ObjectFileUploadStorage()
+    return FileUploadFileStorage()
+
+
+def get_local_path(storage, name):
+    """Returns the path of a stored file, or None if the storage has no local paths (e.g. an object storage)."""
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+class FileUploadBlob(models.Model):
+    """
+    Model to count the references of the file uploads to a stored content (identified by its checksum).
+    The content is stored once as a blob and the files of the file uploads are hardlinks to it. A blob without
+    references is removed by the garbage collector.
+    """
+    checksum = models.CharField(max_length=64)
+    # The same content is stored as a different blob if it is compressed.
+    content_encoding = models.CharField(max_length=10, blank=True, default="")
+    reference_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Blob {self.checksum} ({self.reference_count})"
+
+    @staticmethod
+    def generate_blob_name(checksum, content_encoding):
+        return join(FileUploadBlob.__name__, checksum[:2], checksum[2:4],
+                    f"{checksum}.{content_encoding}" if content_encoding else checksum)
+
+    @property
+    def name(self):
+        return self.generate_blob_name(self.checksum, self.content_encoding)
+
+    @property
+    def path(self):
+        return get_local_path(FileUpload.file.field.storage, self.name)
+
+    @classmethod
+    def reference(cls, file_upload):
+        with transaction.atomic():
+            file_upload_blob, created = cls.objects.get_or_create(checksum=file_upload.checksum,
+                                                                  content_encoding=file_upload.content_encoding,
+                                                                  defaults={"reference_count": 1})
+            if not created:
+                cls.objects.filter(pk=file_upload_blob.pk).update(reference_count=models.F("reference_count") + 1)
+        storage = FileUpload.file.field.storage
+        if not storage.exists(file_upload_blob.name):
+            try:
+                storage.link(file_upload.file.name, file_upload_blob.name)
+            except FileExistsError:
+                pass
+
+    @classmethod
+    def dereference(cls, file_upload, count=1):
+        cls.objects.filter(checksum=file_upload.checksum, content_encoding=file_upload.content_encoding,
+                           reference_count__gt=0).update(
+            reference_count=Greatest(models.F("reference_count") - count, 0)
+        )
+
+    def remove(self):
+        FileUpload.file.field.storage.delete(self.name)
+        self.delete()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("checksum", "content_encoding"),
+                name="unique__checksum_and_content_encoding_of_a_file_upload_blob",
+            ),
+        )
+
+
+class FileUploadStatus(EnhancedTextChoices):
+    PENDING = "pending", _("Pending")
+    PROCESSED = "processed", _("Processed")
+    FAILED = "failed", _("Failed")
+
+
+def is_text_mime_type(mime_type):
+    """Text files (e.g. CSV, TSV, FASTA, see django_common.models.MimeType) compress well"""
+    return mime_type.startswith("text/")
+
+
+def detect_mime_type(file):
+    if hasattr(file, "temporary_file_path"):
+        return detect_mime_type_from_file(file.temporary_file_path())
+    file.seek(0)
+    mime_type = detect_mime_type_from_buffer(file.read(MIME_TYPE_DETECTION_BUFFER_SIZE))
+    file.seek(0)
+    return mime_type
+
 
 def generate_file_path(instance):
     """Defines the file path to store the uploaded file to"""
@@ -37,6 +321,14 @@ def _generate_complete_file_path(instance, filename):
     return join(generate_file_path(instance), str(instance.id), filename)
 
 
+def _generate_staging_file_path(instance, filename):
+    if get_local_path(instance.file.storage, STAGING_DIRECTORY) is None:
+        # Objects cannot be renamed (see the move(...) method of the object storage), so they are stored under a unique
+        # name instead of the id in the directory of the file uploads.
+        return join(generate_file_path(instance), uuid.uuid4().hex, filename)
+    return join(STAGING_DIRECTORY, uuid.uuid4().hex, filename)
+
+
 class FileUpload(models.Model):
     """
     Model to track file uploads.
@@ -47,12 +339,20 @@ class FileUpload(models.Model):
         FileUploadBatch, related_name="file_uploads", on_delete=models.CASCADE, null=False, blank=False
     )
     position = models.PositiveSmallIntegerField()
-    file = models.FileField(upload_to=_generate_complete_file_path, storage=FileUploadFileStorage())
+    file = models.FileField(upload_to=_generate_complete_file_path, storage=get_file_upload_storage)
     detected_mime_type = models.CharField(max_length=100, editable=False)
+    # The checksum and the size of the file as it was uploaded, i.e. before it was compressed.
     checksum = models.CharField(max_length=64, editable=False)
+    original_size = models.PositiveBigIntegerField(null=True, editable=False)
+    # The compression of the stored file (see compression.py), empty if it is stored as it was uploaded.
+    content_encoding = models.CharField(max_length=10, blank=True, default="", editable=False)
+    # Pending until the checksum and the MIME type are calculated if the processing is asynchronous.
+    status = models.CharField(max_length=FileUploadStatus.max_value_length, choices=FileUploadStatus.choices,
+                              default=FileUploadStatus.PROCESSED, editable=False)
+    processing_error = models.TextField(blank=True, default="", editable=False)
 
     def __str__(self):
-        return self.file.path
+        return self.path or self.file.name
 
     @property
     def name(self):
@@ -60,25 +360,254 @@ class FileUpload(models.Model):
 
     @property
     def path(self):
-        return self.file.path
+        """The path of the stored file, None if the storage has no local paths (see STORAGE)."""
+        return get_local_path(self.file.storage, self.file.name)
 
     @property
     def size(self):
-        return self.file.size
+        return self.original_size if self.original_size is not None else self.file.size
 
-    def save(self, *args, **kwargs):
-        # Overriding the function allows to use 'instance.id' in the 'file_path' function.
-        if self.pk is None:
-            tmp = self.file
-            self.file = None
-            super().save(*args, **kwargs)
-            self.file = tmp
-            super().save(update_fields=("file",))
+    def open_content(self):
+        """Opens the file and decompresses it on the fly if it is stored compressed."""
+        return open_decompressed(self.file.open("rb"), self.content_encoding)
+
+    def _prepare_content(self):
+        content = self.file.file
+        # The checksum and the MIME type may have been calculated while the file was received (see
+        # uploadhandlers.py), otherwise the file needs to be read again after it was stored.
+        self.checksum = getattr(content, "checksum", "")
+        self.detected_mime_type = getattr(content, "detected_mime_type", "")
+        self._line_index_builder = getattr(content, "line_index_builder", None)
+        self.original_size = content.size
+        self.content_encoding = ""
+        if not ASYNCHRONOUS_PROCESSING and self.path is None:
+            # Reading the received file is cheaper than reading the stored file again from a remote storage.
+            if not self.detected_mime_type:
+                self.detected_mime_type = detect_mime_type(content)
+            if not self.checksum:
+                self.checksum = generate_checksum_from_chunks(content.chunks())
+        # If the processing is asynchronous, a file whose checksum was not calculated while it was received is stored
+        # uncompressed, as the upload request must not read it.
+        if COMPRESSION and (self.checksum or not ASYNCHRONOUS_PROCESSING):
+            # As the stored file is compressed, it is too late to analyze it after it was stored.
+            if not self.detected_mime_type:
+                self.detected_mime_type = detect_mime_type(content)
+            if is_text_mime_type(self.detected_mime_type):
+                if not self.checksum:
+                    self.checksum = generate_checksum_from_chunks(content.chunks())
+                compressed_content = GzipCompressedFile(content)
+                self.file = compressed_content
+                self.content_encoding = compressed_content.content_encoding
+
+    def calculate_checksum(self):
+        """Calculates the checksum of the stored file (decompressed)."""
+        path = self.path
+        if path is not None and not self.content_encoding:
+            return generate_checksum_from_file(path)
+        with self.open_content() as file:
+            return generate_checksum_from_chunks(iter(lambda: file.read(FILE_READ_BUFFER_SIZE), b""))
+
+    def _complete_metadata(self):
+        # The checksum and the MIME type are calculated from the stored file if they were not calculated before.
+        if not self.checksum:
+            self.checksum = self.calculate_checksum()
+        if not self.detected_mime_type:
+            path = self.path
+            if path is not None:
+                self.detected_mime_type = detect_mime_type_from_file(path)
+            else:
+                with self.file.storage.open(self.file.name, "rb") as file:
+                    self.detected_mime_type = detect_mime_type_from_buffer(file.read(MIME_TYPE_DETECTION_BUFFER_SIZE))
+
+    def store_file(self):
+        """
+        Stores the file under a staging name before the id is allocated and the record is inserted, e.g. outside of a
+        transaction (see promote_file()).
+        """
+        if isinstance(self.file.file, FileUploadReference):
+            self._store_reference(self.file.file.file_upload)
+            return
+        self._prepare_content()
+        name = _generate_staging_file_path(self, self.file.name)
+        if not self._link_blob(name):
+            self.file = self.file.storage.save(name, self.file.file)
+        if ASYNCHRONOUS_PROCESSING:
+            self.status = FileUploadStatus.PENDING
+        else:
+            self._complete_metadata()
+            self._build_line_index()
+
+    def _build_line_index(self):
+        # The line index of a text file is built while it is received (see uploadhandlers.py), otherwise from the
+        # stored file.
+        self._line_index = None
+        if not LINE_INDEX_INTERVAL or not is_text_mime_type(self.detected_mime_type):
+            return
+        builder = getattr(self, "_line_index_builder", None)
+        if builder is None:
+            with self.open_content() as file:
+                builder = LineIndexBuilder.from_file(file)
+        self._line_index = FileUploadLineIndex(file_upload_id=self.pk, interval=builder.interval,
+                                               line_count=builder.line_count, offsets=pack_offsets(builder.offsets))
+
+    def _link_blob(self, name):
+        # A file whose content is already stored as a blob (see FileUploadBlob) is linked to it instead of being stored
+        # again.
+        if not (DEDUPLICATION and self.checksum):
+            return False
+        try:
+            self.file.storage.link(FileUploadBlob.generate_blob_name(self.checksum, self.content_encoding), name)
+        except FileNotFoundError:
+            return False
+        self.file = name
+        return True
+
+    def _store_reference(self, file_upload):
+        # The stored file (compressed or not) of the referenced file upload is shared with a link (see the link(...)
+        # method of the storage) when the file is promoted, so that it is not copied twice in an object storage.
+        self._referenced_file_name = file_upload.file.name
+        self.checksum = file_upload.checksum
+        self.detected_mime_type = file_upload.detected_mime_type
+        self.original_size = file_upload.original_size
+        self.content_encoding = file_upload.content_encoding
+        self._line_index = FileUploadLineIndex.objects.filter(file_upload=file_upload).first()
+
+    def promote_file(self):
+        """
+        Moves the file that was stored with store_file() to its path, which contains the id (e.g. an id in flight, see
+        django_common.postgresql.in_flight_ids), with a rename. In an object storage, the file keeps its name (see
+        the move(...) method of the storage).
+        """
+        name = self.file.field.generate_filename(self, self.name)
+        referenced_file_name = getattr(self, "_referenced_file_name", None)
+        if referenced_file_name is not None:
+            self.file.storage.link(referenced_file_name, name)
+            self._referenced_file_name = None
         else:
+            name = self.file.storage.move(self.file.name, name)
+        self.file = name
+        if getattr(self, "_line_index", None) is not None:
+            self._line_index.file_upload_id = self.pk
+
+    def discard_file(self):
+        """
+        Removes a file that was stored with store_file(...) (and possibly promoted) but whose record was never inserted.
+        """
+        if getattr(self, "_referenced_file_name", None) is not None:
+            # The referenced file was not linked yet.
+            return
+        path = self.path
+        self.file.delete(save=False)
+        if path is not None:
+            try:
+                os.rmdir(dirname(path))
+            except OSError:
+                pass
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with ExitStack() as stack:
+            if self.file and not self.file._committed:
+                self.store_file()
+                if self.pk is None:
+                    # The id is allocated before the file is moved to its path, which contains it, so that the record
+                    # is inserted with a single statement.
+                    self.pk = stack.enter_context(in_flight_ids(FileUpload, 1))[0]
+                self.promote_file()
+            elif adding and self.file:
+                self._complete_metadata()
+            if adding:
+                kwargs.setdefault("force_insert", True)
+                # The statistics, the blob reference and the line index are only updated if the record is inserted.
+                stack.enter_context(transaction.atomic())
             super().save(*args, **kwargs)
-        self.checksum = generate_checksum_from_file(self.file.path)
-        self.detected_mime_type = magic.from_file(self.path, mime=True)
-        super().save(update_fields=("detected_mime_type", "checksum"))
+            if adding:
+                self._inserted((self,))
+
+    @classmethod
+    def _inserted(cls, file_uploads):
+        file_upload_batch_ids = {file_upload.file_upload_batch_id for file_upload in file_uploads}
+        for file_upload_batch_id in file_upload_batch_ids:
+            batch_file_uploads = [f for f in file_uploads if f.file_upload_batch_id == file_upload_batch_id]
+            FileUploadBatch.count_file_uploads(file_upload_batch_id, len(batch_file_uploads),
+                                               sum(f.size for f in batch_file_uploads))
+        for file_upload in file_uploads:
+            # The blob of a pending file upload is referenced when it is processed.
+            if DEDUPLICATION and file_upload.checksum:
+                FileUploadBlob.reference(file_upload)
+        line_indexes = [f._line_index for f in file_uploads if getattr(f, "_line_index", None) is not None]
+        if line_indexes:
+            FileUploadLineIndex.objects.bulk_create(line_indexes)
+        if any(file_upload.status == FileUploadStatus.PENDING for file_upload in file_uploads):
+            transaction.on_commit(lambda: notify(PROCESSING_CHANNEL))
+
+    def process(self, verify_checksum=None):
+        """
+        Calculates the checksum and the MIME type of a pending file upload (see ASYNCHRONOUS_PROCESSING).
+        A checksum that was not known when the file was uploaded is passed to verify_checksum(...), which raises an
+        exception if it is incorrect, before anything is saved.
+        """
+        had_checksum = bool(self.checksum)
+        self._complete_metadata()
+        if not had_checksum and verify_checksum is not None:
+            verify_checksum(self.checksum)
+        self._build_line_index()
+        self.status = FileUploadStatus.PROCESSED
+        self.processing_error = ""
+        self.save(update_fields=("checksum", "detected_mime_type", "status", "processing_error"))
+        # The Merkle root covers the checksum, which is only known now.
+        FileUploadBatch.summarize_processed_file_uploads(self.file_upload_batch_id)
+        if self._line_index is not None:
+            FileUploadLineIndex.objects.update_or_create(
+                file_upload_id=self.pk,
+                defaults={f: getattr(self._line_index, f) for f in ("interval", "line_count", "offsets")},
+            )
+        if DEDUPLICATION and not had_checksum:
+            FileUploadBlob.reference(self)
+
+    @classmethod
+    def bulk_insert(cls, file_uploads):
+        """
+        Inserts the records of file uploads whose files were stored and promoted (see store_file()) with a single
+        statement.
+        """
+        file_uploads = cls.objects.bulk_create(file_uploads)
+        cls._inserted(file_uploads)
+        return file_uploads
+
+    @classmethod
+    def bulk_delete(cls, file_uploads):
+        """
+        Deletes the records of file uploads (but not their files, see discard_file()) and updates the statistics, the
+        quotas and the blob references with a statement per batch and content instead of per file upload.
+        """
+        _bulk_deletion.active = True
+        try:
+            cls.objects.filter(pk__in=[file_upload.pk for file_upload in file_uploads]).delete()
+        finally:
+            _bulk_deletion.active = False
+        file_upload_batch_ids = {file_upload.file_upload_batch_id for file_upload in file_uploads}
+        # The file names and the Merkle roots of batches that are marked as deleted are not summarized again.
+        deleted_file_upload_batch_ids = set(FileUploadBatch.objects.filter(
+            pk__in=file_upload_batch_ids, deleted_on__isnull=False
+        ).values_list("pk", flat=True))
+        for file_upload_batch_id in file_upload_batch_ids:
+            batch_file_uploads = [f for f in file_uploads
+                                  if f.file_upload_batch_id == file_upload_batch_id and f.original_size is not None]
+            if batch_file_uploads:
+                FileUploadBatch.count_file_uploads(file_upload_batch_id, -len(batch_file_uploads),
+                                                   -sum(f.original_size for f in batch_file_uploads),
+                                                   summarize=file_upload_batch_id not in deleted_file_upload_batch_ids)
+        if DEDUPLICATION:
+            blob_file_uploads = {}
+            blob_counts = Counter()
+            for file_upload in file_uploads:
+                if file_upload.checksum:
+                    key = (file_upload.checksum, file_upload.content_encoding)
+                    blob_file_uploads[key] = file_upload
+                    blob_counts[key] += 1
+            for key, count in blob_counts.items():
+                FileUploadBlob.dereference(blob_file_uploads[key], count)
 
     class Meta:
         constraints = (
@@ -88,3 +617,213 @@ class FileUpload(models.Model):
             ),
             # TODO Check if the file_upload_batch_position values are aligned.
         )
+        indexes = (
+            # Created concurrently (see the migration), as the table may be large.
+            models.Index(fields=("checksum",), name="fileupload_checksum_index"),
+        )
+
+
+# The signal receivers skip the file uploads that are deleted with FileUpload.bulk_delete(...).
+_bulk_deletion = threading.local()
+
+
+def _dereference_file_upload_blob(sender, instance, **kwargs):
+    if DEDUPLICATION and instance.checksum and not getattr(_bulk_deletion, "active", False):
+        FileUploadBlob.dereference(instance)
+
+
+def _uncount_file_upload(sender, instance, **kwargs):
+    if instance.original_size is not None and not getattr(_bulk_deletion, "active", False):
+        FileUploadBatch.count_file_uploads(instance.file_upload_batch_id, -1, -instance.original_size)
+
+
+post_delete.connect(_dereference_file_upload_blob, sender=FileUpload)
+post_delete.connect(_uncount_file_upload, sender=FileUpload)
+
+
+class FileUploadLineIndex(models.Model):
+    """
+    Model to store the byte offsets of every interval-th line of a text file upload (see lineindex.py), so that a
+    range of lines is read with a seek instead of a scan from the beginning.
+    """
+    file_upload = models.OneToOneField(FileUpload, related_name="line_index", on_delete=models.CASCADE,
+                                       primary_key=True)
+    interval = models.PositiveIntegerField()
+    line_count = models.PositiveBigIntegerField()
+    # The offsets of the lines interval, 2 * interval, ... (see pack_offsets(...)) in the decompressed file.
+    offsets = models.BinaryField()
+
+    def __str__(self):
+        return f"Line index of {self.file_upload_id} ({self.line_count} lines)"
+
+    def locate(self, line):
+        """Returns the offset of the closest indexed line before a line and the number of that indexed line."""
+        i = min(line // self.interval, len(self.offsets) // 8)
+        return (unpack_offset(self.offsets, i - 1) if i else 0), i * self.interval
+
+
+def read_lines(file, start, stop, maximum_size, offset=0, offset_line=0):
+    """
+    Reads the lines [start, stop) of a file (seeked from the offset of a line before) but at most a number of bytes.
+    Returns the lines and whether they were truncated.
+    """
+    file.seek(offset)
+    remaining = maximum_size
+    for _ in range(start - offset_line):
+        # Skips the lines before in chunks, so that a long line is not read into memory at once.
+        while True:
+            data = file.readline(remaining)
+            if not data or data.endswith(NEWLINE):
+                break
+        if not data:
+            return [], False
+    lines = []
+    for _ in range(stop - start):
+        data = file.readline(remaining)
+        if not data:
+            break
+        remaining -= len(data)
+        lines.append(data)
+        if remaining <= 0:
+            return lines, True
+    return lines, False
+
+
+class FileUploadSession(OwnedModel):
+    """
+    Model to track a resumable upload of a single file.
+    The file is sent in byte ranges (chunks) that are written into a spool file
+    next to the file uploads until it is complete and committed into a FileUpload.
+    """
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # The optional checksum of the complete file as announced by the client.
+    checksum = models.CharField(max_length=64, blank=True)
+    created_on = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Session {self.id} ({self.name})"
+
+    @property
+    def directory(self):
+        # The spool file is within the storage, so that it can be moved into it, unless it has no local paths.
+        name = join(generate_file_path(self), str(self.id))
+        return get_local_path(FileUpload.file.field.storage, name) or join(get_spool_directory(), name)
+
+    @property
+    def path(self):
+        return join(self.directory, "spool")
+
+    @property
+    def offset(self):
+        """The number of bytes received without a gap from the beginning of the file"""
+        offset = 0
+        for chunk_offset, chunk_size in self.chunks.order_by("offset").values_list("offset", "size"):
+            if chunk_offset > offset:
+                break
+            offset = max(offset, chunk_offset + chunk_size)
+        return offset
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+    def allocate(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.truncate(self.size)
+
+    def write_chunk(self, offset, size, stream, checksum):
+        """
+        Writes the chunk read from the stream at its offset into the spool file.
+        Chunks can be written in parallel. A chunk only counts as received if
+        it is complete and its checksum matches. The chunk is verified in a
+        temporary file before it is written into the spool file, so that a
+        rejected retry does not overwrite a range that was already received.
+        """
+        sha256 = hashlib.sha256()
+        remaining = size
+        with tempfile.TemporaryFile(dir=self.directory) as chunk_file:
+            while remaining > 0:
+                data = stream.read(min(FILE_READ_BUFFER_SIZE, remaining))
+                if not data:
+                    break
+                sha256.update(data)
+                chunk_file.write(data)
+                remaining -= len(data)
+            if remaining != 0 or sha256.hexdigest() != checksum:
+                return False
+            chunk_file.seek(0)
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                position = offset
+                for data in iter(lambda: chunk_file.read(FILE_READ_BUFFER_SIZE), b""):
+                    os.pwrite(fd, data, position)
+                    position += len(data)
+            finally:
+                os.close(fd)
+        FileUploadSessionChunk.objects.update_or_create(
+            file_upload_session=self, offset=offset, defaults={"size": size, "checksum": checksum}
+        )
+        return True
+
+    def open(self):
+        return FileUploadSessionFile(self)
+
+    def discard(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.delete()
+
+
+class FileUploadSessionChunk(models.Model):
+    file_upload_session = models.ForeignKey(
+        FileUploadSession, related_name="chunks", on_delete=models.CASCADE, null=False, blank=False
+    )
+    offset = models.PositiveBigIntegerField()
+    size = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("file_upload_session", "offset"),
+                name="unique__offset_in_a_file_upload_session",
+            ),
+        )
+
+
+class FileUploadSessionFile(File):
+    """
+    The complete spool file of a file upload session.
+    As it provides a temporary file path, the storage moves it instead of copying it. The path is a hardlink of the
+    spool file, so that the spool file is kept (and the session can be committed again) until the session is discarded
+    after the commit, even if the moved file is discarded because the commit fails.
+    """
+
+    def __init__(self, file_upload_session):
+        super().__init__(open(file_upload_session.path, "rb"), file_upload_session.name)
+        self.file_upload_session = file_upload_session
+        self.path = join(file_upload_session.directory, "commit")
+        with suppress(FileNotFoundError):
+            os.remove(self.path)
+        try:
+            os.link(file_upload_session.path, self.path)
+        except OSError:
+            shutil.copyfile(file_upload_session.path, self.path)
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class FileUploadReference(File):
+    """
+    A file upload that is referenced instead of uploaded again (see FileUploadBatchViewSet.preflight(...)).
+    It provides the checksum and the MIME type of the referenced file upload, so that its file is not read.
+    """
+
+    def __init__(self, file_upload):
+        super().__init__(None, file_upload.name)
+        self.file_upload = file_upload
+        self.checksum = file_upload.checksum
+        self.detected_mime_type = file_upload.detected_mime_type
+        self.size = file_upload.size
@@ -0,0 +1,279 @@
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from os import environ
+
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+from python_utilities.crypto import FILE_READ_BUFFER_SIZE
+
+"""
+An S3-compatible object storage for the file uploads (see DJANGO_FILEUPLOAD_STORAGE), which requires boto3 unless a
+client is passed.
+
+The client can be anything with the methods of a boto3 S3 client that are used below, e.g. a client of a local
+S3-compatible service (see DJANGO_FILEUPLOAD_OBJECT_STORAGE_ENDPOINT_URL) or an in-process fake like moto's:
+
+FileUpload.file.field.storage = ObjectFileUploadStorage(client=client, bucket="test")
+"""
+
+# The bucket and the prefix of the keys of the objects, and the endpoint of a service other than AWS (e.g. MinIO). The
+# credentials are looked up by boto3 (e.g. the AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables).
+OBJECT_STORAGE_BUCKET = environ.get("DJANGO_FILEUPLOAD_OBJECT_STORAGE_BUCKET", "")
+OBJECT_STORAGE_PREFIX = environ.get("DJANGO_FILEUPLOAD_OBJECT_STORAGE_PREFIX", "")
+OBJECT_STORAGE_ENDPOINT_URL = environ.get("DJANGO_FILEUPLOAD_OBJECT_STORAGE_ENDPOINT_URL") or None
+# Larger files are uploaded in parts of this size (at least 5 MiB), of which at most this number per file are uploaded
+# in parallel, so that at most one more part per file is buffered in memory.
+OBJECT_STORAGE_PART_SIZE = int(environ.get("DJANGO_FILEUPLOAD_OBJECT_STORAGE_PART_SIZE", 16777216))
+OBJECT_STORAGE_UPLOAD_WORKERS = int(environ.get("DJANGO_FILEUPLOAD_OBJECT_STORAGE_UPLOAD_WORKERS", 4))
+
+# The maximum size of an object that can be copied with a single request.
+MAXIMUM_COPY_SIZE = 5368709120
+COPY_PART_SIZE = 1073741824
+
+
+def _error_code(exception):
+    return getattr(exception, "response", {}).get("Error", {}).get("Code")
+
+
+def _is_not_found(exception):
+    return _error_code(exception) in ("404", "NoSuchKey", "NotFound")
+
+
+class _ObjectReader(io.RawIOBase):
+    """
+    Reads an object from the current position with a ranged GET request, which is only sent when it is read and
+    restarted when it is seeked, e.g. to the byte ranges of a download.
+    """
+
+    def __init__(self, storage, key, size):
+        super().__init__()
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.position = 0
+        self.body = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset != self.position:
+            self._close_body()
+            self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        if self.body is None:
+            self.body = self.storage.client.get_object(Bucket=self.storage.bucket, Key=self.key,
+                                                       Range=f"bytes={self.position}-")["Body"]
+        data = self.body.read(len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def _close_body(self):
+        if self.body is not None:
+            self.body.close()
+            self.body = None
+
+    def close(self):
+        self._close_body()
+        super().close()
+
+
+class ObjectFile(File):
+    def __init__(self, storage, name, size):
+        self.storage = storage
+        self.key = storage._key(name)
+        super().__init__(self._open_reader(size), name)
+        self.mode = "rb"
+        self.size = size
+
+    def _open_reader(self, size):
+        return io.BufferedReader(_ObjectReader(self.storage, self.key, size),
+                                 FILE_READ_BUFFER_SIZE)
+
+    def open(self, mode=None):
+        # The object has no local path to be reopened from.
+        if self.closed:
+            self.file = self._open_reader(self.size)
+        else:
+            self.seek(0)
+        return self
+
+
+@deconstructible
+class ObjectFileUploadStorage(Storage):
+    """
+    Files are streamed into the objects in parts (multipart uploads) and read with ranged requests.
+    Like the FileUploadFileStorage, it never stores a file under an alternative name and has a link(...) method, which
+    copies the object on the server (so deduplication is not supported, see DEDUPLICATION), and a move(...) method,
+    which keeps the object where it is. There are no local paths, so downloads are not sent with sendfile.
+    """
+
+    def __init__(self, client=None, bucket=None, prefix=None, part_size=None, upload_workers=None):
+        self._client = client
+        self.bucket = bucket or OBJECT_STORAGE_BUCKET
+        self.prefix = OBJECT_STORAGE_PREFIX if prefix is None else prefix
+        self.part_size = part_size or OBJECT_STORAGE_PART_SIZE
+        self.upload_workers = upload_workers or OBJECT_STORAGE_UPLOAD_WORKERS
+
+    @cached_property
+    def client(self):
+        if self._client is not None:
+            return self._client
+        import boto3
+        return boto3.client("s3", endpoint_url=OBJECT_STORAGE_ENDPOINT_URL)
+
+    @cached_property
+    def _upload_pool(self):
+        return ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="fileupload-objectstorage")
+
+    def _key(self, name):
+        return self.prefix + name.replace("\\", "/")
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(name) from e
+            raise
+
+    def get_alternative_name(self, file_root, file_ext):
+        raise FileExistsError
+
+    def _open(self, name, mode="rb"):
+        if "w" in mode or "a" in mode or "+" in mode:
+            raise ValueError("Objects can only be opened for reading.")
+        return ObjectFile(self, name, self._head(name)["ContentLength"])
+
+    def _parts(self, content):
+        """Yields the content in parts of the part size (and a smaller last part)."""
+        buffer = bytearray()
+        for chunk in content.chunks():
+            buffer += chunk
+            while len(buffer) >= self.part_size:
+                yield bytes(buffer[:self.part_size])
+                del buffer[:self.part_size]
+        yield bytes(buffer)
+
+    def _multipart_upload(self, name, parts):
+        """
+        Uploads the parts (callables that upload a part with its number and return its ETag) in parallel. At most the
+        number of upload workers are in flight, so that the parts are generated only as fast as they are uploaded.
+        """
+        key = self._key(name)
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+        etags = []
+        pending = deque()
+        try:
+            for part_number, part in enumerate(parts, 1):
+                if len(pending) >= self.upload_workers:
+                    etags.append(pending.popleft().result())
+                pending.append(self._upload_pool.submit(part, key, upload_id, part_number))
+            while pending:
+                etags.append(pending.popleft().result())
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={"Parts": [{"PartNumber": i, "ETag": etag} for i, etag in enumerate(etags, 1)]},
+            )
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            # Parts that are uploaded after the abortion would be stored (and charged) until the next abortion.
+            wait(pending)
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def _save(self, name, content):
+        parts = self._parts(content)
+        first_part = next(parts)
+        second_part = next(parts, b"")
+        if not second_part:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=first_part)
+            return name
+
+        def upload_part(data):
+            def upload(key, upload_id, part_number):
+                return self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                               PartNumber=part_number, Body=data)["ETag"]
+            return upload
+
+        def generate_parts():
+            yield upload_part(first_part)
+            yield upload_part(second_part)
+            for data in parts:
+                if data:
+                    yield upload_part(data)
+
+        self._multipart_upload(name, generate_parts())
+        return name
+
+    def link(self, source_name, name):
+        """Stores the content of a stored object under another name with a copy on the server."""
+        if self.exists(name):
+            raise FileExistsError(name)
+        size = self._head(source_name)["ContentLength"]
+        source = {"Bucket": self.bucket, "Key": self._key(source_name)}
+        if size <= MAXIMUM_COPY_SIZE:
+            self.client.copy_object(Bucket=self.bucket, Key=self._key(name), CopySource=source)
+            return
+
+        def copy_part(start, stop):
+            def copy(key, upload_id, part_number):
+                return self.client.upload_part_copy(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, CopySource=source,
+                    CopySourceRange=f"bytes={start}-{stop - 1}",
+                )["CopyPartResult"]["ETag"]
+            return copy
+
+        self._multipart_upload(name, (copy_part(start, min(start + COPY_PART_SIZE, size))
+                                      for start in range(0, size, COPY_PART_SIZE)))
+
+    def move(self, source_name, name):
+        """
+        Objects cannot be renamed (only copied), so an object keeps its name, which is returned. Unlike on the
+        filesystem, the garbage collector does not compare the names with the records.
+        """
+        return source_name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def exists(self, name):
+        try:
+            self._head(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def listdir(self, path):
+        prefix = self._key(path).rstrip("/") + "/" if path else self.prefix
+        directories, files = [], []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix,
+                                                                          Delimiter="/"):
+            directories.extend(p["Prefix"][len(prefix):].rstrip("/") for p in page.get("CommonPrefixes", ()))
+            files.extend(o["Key"][len(prefix):] for o in page.get("Contents", ()))
+        return directories, files
+
+    def size(self, name):
+        return self._head(name)["ContentLength"]
+
+    def get_modified_time(self, name):
+        return self._head(name)["LastModified"]
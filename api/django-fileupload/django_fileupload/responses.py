@@ -0,0 +1,208 @@
+import asyncio
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+
+from django.core.files import File
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from python_utilities.crypto import FILE_READ_BUFFER_SIZE
+
+from django_common.sendfile import is_sendfile_enabled, sendfile_response
+
+BYTE_RANGE_PATTERN = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+# A Range header with more ranges is ignored and the whole file is sent.
+MAXIMUM_RANGES = int(environ.get("DJANGO_FILEUPLOAD_MAXIMUM_RANGES", 16))
+# The content of a file upload never changes, so it can be cached by the browser for as long as it likes.
+CACHE_CONTROL = environ.get("DJANGO_FILEUPLOAD_DOWNLOAD_CACHE_CONTROL", "private, max-age=31536000, immutable")
+# Asynchronous downloads (under ASGI) read the files in chunks of this size in a thread pool of this size, and send at
+# most this number of files per process at the same time (the others wait).
+ASYNCHRONOUS_DOWNLOAD_CHUNK_SIZE = int(environ.get("DJANGO_FILEUPLOAD_ASYNCHRONOUS_DOWNLOAD_CHUNK_SIZE", 262144))
+ASYNCHRONOUS_DOWNLOAD_READ_WORKERS = int(environ.get("DJANGO_FILEUPLOAD_ASYNCHRONOUS_DOWNLOAD_READ_WORKERS", 16))
+ASYNCHRONOUS_DOWNLOAD_CONCURRENCY = int(environ.get("DJANGO_FILEUPLOAD_ASYNCHRONOUS_DOWNLOAD_CONCURRENCY", 100))
+
+_asynchronous_download_read_pool = ThreadPoolExecutor(max_workers=ASYNCHRONOUS_DOWNLOAD_READ_WORKERS,
+                                                      thread_name_prefix="fileupload-download")
+_asynchronous_download_semaphore = asyncio.Semaphore(ASYNCHRONOUS_DOWNLOAD_CONCURRENCY)
+
+
+def parse_range_header(header, size):
+    """
+    Parses the value of a Range header into a sorted list of non-overlapping (start, stop) byte windows.
+    Returns None if the header must be ignored and an empty list if none of the ranges is satisfiable.
+    See also https://www.rfc-editor.org/rfc/rfc9110#name-range
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        match = BYTE_RANGE_PATTERN.match(spec)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            stop = int(last) + 1 if last else size
+        elif last:
+            start = max(size - int(last), 0)
+            stop = size
+            if start == stop:
+                continue
+        else:
+            return None
+        if start < size:
+            ranges.append((start, min(stop, size)))
+    if len(ranges) > MAXIMUM_RANGES:
+        return None
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        # Entity tags must match with the strong comparison.
+        return etag is not None and if_range == etag
+    if last_modified is None or if_range.startswith("W/"):
+        return False
+    return parse_http_date_safe(if_range) == int(last_modified.timestamp())
+
+
+def _read(file, ranges, parts=None):
+    """Yields the bytes of the ranges, optionally framed by the parts of a multipart/byteranges body."""
+    try:
+        for i, (start, stop) in enumerate(ranges):
+            if parts is not None:
+                yield parts[i]
+            file.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                data = file.read(min(FILE_READ_BUFFER_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        if parts is not None:
+            yield parts[-1]
+    finally:
+        file.close()
+
+
+async def _aread(file, ranges, parts=None):
+    """
+    Yields the bytes of the ranges like _read(...), but reads them in a thread pool without blocking the event loop.
+    """
+    try:
+        async with _asynchronous_download_semaphore:
+            loop = asyncio.get_running_loop()
+            for i, (start, stop) in enumerate(ranges):
+                if parts is not None:
+                    yield parts[i]
+                await loop.run_in_executor(_asynchronous_download_read_pool, file.seek, start)
+                remaining = stop - start
+                while remaining > 0:
+                    data = await loop.run_in_executor(_asynchronous_download_read_pool, file.read,
+                                                      min(ASYNCHRONOUS_DOWNLOAD_CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+            if parts is not None:
+                yield parts[-1]
+    finally:
+        file.close()
+
+
+def content_disposition(file_name):
+    return 'attachment; filename="%s"' % file_name
+
+
+def _set_validator_headers(response, etag, last_modified):
+    if etag is not None:
+        response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    if CACHE_CONTROL:
+        response["Cache-Control"] = CACHE_CONTROL
+    return response
+
+
+def conditional_response(request, etag=None, last_modified=None):
+    """
+    Evaluates the conditional request headers (If-None-Match, If-Modified-Since, If-Match and If-Unmodified-Since)
+    without touching the file. Returns a 304 (Not Modified) or 412 (Precondition Failed) response or None if the file
+    needs to be sent.
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified is not None else None,
+    )
+    if response is not None:
+        return _set_validator_headers(response, etag, last_modified)
+    return None
+
+
+def file_response(request, open_file, size, content_type, file_name, etag=None, last_modified=None, file_path=None,
+                  asynchronous=False):
+    """
+    Creates the response to download a file, or only the byte ranges of it that were requested with a Range header.
+    The "open_file" callable is only called if the response has a body.
+    If sendfile is enabled and the file has a path, the web server sends the file (and handles the byte ranges).
+    If asynchronous, the body is an asynchronous iterator, which ASGI servers consume without a thread per chunk.
+    """
+    read = _aread if asynchronous else _read
+    if file_path is not None and is_sendfile_enabled():
+        response = sendfile_response(file_path, content_type)
+        response["Content-Disposition"] = content_disposition(file_name)
+        return _set_validator_headers(response, etag, last_modified)
+
+    ranges = parse_range_header(request.META.get("HTTP_RANGE"), size)
+    if ranges is not None and not _if_range_matches(request, etag, last_modified):
+        ranges = None
+
+    if ranges is None:
+        file = open_file()
+        if isinstance(file, File) and not asynchronous:
+            response = FileResponse(file, content_type=content_type)
+        else:
+            # E.g. a decompressing file, which must not be sent with sendfile by the WSGI server.
+            response = StreamingHttpResponse(read(file, ((0, size),)), content_type=content_type)
+        response["Content-Length"] = size
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        response = StreamingHttpResponse(read(open_file(), ranges), status=206, content_type=content_type)
+        response["Content-Length"] = stop - start
+        response["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+    else:
+        boundary = secrets.token_hex(16)
+        parts = [
+            (("\r\n" if i else "") + f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+             f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode()
+            for i, (start, stop) in enumerate(ranges)
+        ] + [f"\r\n--{boundary}--\r\n".encode()]
+        response = StreamingHttpResponse(read(open_file(), ranges, parts), status=206,
+                                         content_type=f"multipart/byteranges; boundary={boundary}")
+        response["Content-Length"] = sum(len(p) for p in parts) + sum(stop - start for start, stop in ranges)
+
+    response["Accept-Ranges"] = "bytes"
+    response["Content-Disposition"] = content_disposition(file_name)
+    return _set_validator_headers(response, etag, last_modified)
@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
-from django_fileupload.models import FileUpload, FileUploadBatch
+from django_fileupload.models import FileUpload, FileUploadBatch, FileUploadSession
+
+# A SHA-256 checksum in hexadecimal digits (see python_utilities.crypto).
+CHECKSUM_PATTERN = r"^[0-9a-fA-F]{64}$"
 
 
 class FileUploadSerializer(serializers.ModelSerializer):
@@ -8,10 +11,11 @@ class FileUploadSerializer(serializers.ModelSerializer):
     Default serializer for a file upload record.
     """
     name = serializers.CharField(read_only=True)
+    size = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = FileUpload
-        fields = ("id", "name", "checksum")
+        fields = ("id", "name", "position", "checksum", "size", "status")
 
 
 class FileUploadBatchSerializer(serializers.ModelSerializer):
@@ -23,10 +27,116 @@ class FileUploadBatchSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = FileUploadBatch
-        fields = ("file_uploads",)
+        fields = ("file_uploads", "file_count", "total_size", "merkle_root")
 
 
 class FileUploadBatchCreateSerializer(serializers.ModelSerializer):
+    references = serializers.JSONField(
+        required=False, write_only=True,
+        help_text="Maps positions to the ids of file uploads that are referenced instead of uploaded again (see the "
+                  "preflight action). The uploaded files fill the other positions in their order.",
+    )
+
     class Meta:
         model = FileUploadBatch
-        fields = ("id",)
\ No newline at end of file
+        fields = ("id", "references")
+
+
+class FileUploadBatchSessionsSerializer(serializers.Serializer):
+    """
+    Serializer for committing complete file upload sessions into a file upload batch.
+    The order of the sessions defines the position of the files in the batch.
+    """
+    sessions = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class FileUploadBatchBulkDeleteSerializer(serializers.Serializer):
+    """
+    Serializer for the deletion of file upload batches, whose file uploads and files are deleted in the background.
+    """
+    file_upload_batches = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class FileUploadBatchBulkDeleteResultSerializer(serializers.Serializer):
+    # The number of file upload batches that were marked as deleted (without the ones that already were).
+    deleted = serializers.IntegerField()
+
+
+class FileUploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Default serializer for a file upload session record.
+    """
+    offset = serializers.IntegerField(read_only=True)
+    checksum = serializers.RegexField(CHECKSUM_PATTERN, required=False, allow_blank=True)
+
+    class Meta:
+        model = FileUploadSession
+        fields = ("id", "name", "size", "checksum", "offset")
+
+    def validate_checksum(self, value):
+        # Compared with the lowercase checksum of the complete file when the session is committed.
+        return value.lower()
+
+
+class FileUploadProcessingSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = FileUpload
+        fields = ("id", "name", "status", "processing_error")
+
+
+class FileUploadBatchProcessingSerializer(serializers.Serializer):
+    """
+    Serializer for the progress of the asynchronous processing of the files of a file upload batch.
+    """
+    pending = serializers.IntegerField()
+    processed = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    file_uploads = FileUploadProcessingSerializer(many=True)
+
+
+class FilePreflightSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=0)
+    checksum = serializers.RegexField(CHECKSUM_PATTERN)
+
+
+class FileUploadBatchPreflightSerializer(serializers.Serializer):
+    """
+    Serializer for the lookup of files that are already stored before a file upload batch is uploaded.
+    """
+    files = FilePreflightSerializer(many=True, allow_empty=False)
+
+
+class FilePreflightResultSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    # The id of a stored file upload with the same content, which can be referenced, or null.
+    file_upload = serializers.IntegerField(allow_null=True)
+
+
+class FileUploadLinesSerializer(serializers.Serializer):
+    """
+    Serializer for a range of lines of a text file.
+    """
+    start = serializers.IntegerField()
+    stop = serializers.IntegerField()
+    # The number of lines of the file, null if it has no line index.
+    line_count = serializers.IntegerField(allow_null=True)
+    lines = serializers.ListField(child=serializers.CharField(allow_blank=True, trim_whitespace=False))
+    # The lines were cut off at the maximum size of a response.
+    truncated = serializers.BooleanField()
+
+
+class FileUploadBatchMerkleSerializer(serializers.Serializer):
+    """
+    Serializer for a range of the nodes of a level of the Merkle tree of a file upload batch.
+    """
+    merkle_root = serializers.CharField()
+    # The level of the root, the leaves are at level 0.
+    height = serializers.IntegerField()
+    level = serializers.IntegerField()
+    # The number of nodes of the level.
+    node_count = serializers.IntegerField()
+    start = serializers.IntegerField()
+    nodes = serializers.ListField(child=serializers.CharField())
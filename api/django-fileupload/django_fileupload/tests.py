@@ -0,0 +1,335 @@
+import io
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from django_fileupload.models import FileUpload, FileUploadBatch
+from django_fileupload.objectstorage import ObjectFileUploadStorage, _ObjectReader
+from django_fileupload.views import FileUploadBatchViewSet, FileUploadViewSet
+
+
+class _BarrierFileUploadBatchViewSet(FileUploadBatchViewSet):
+    barrier = None
+
+    def add_metadata(self, request, create_file_upload_batch):
+        file_upload_batch = create_file_upload_batch()
+        # Every uploader has to be within its transaction at the same time, which a lock across the uploads prevents.
+        self.barrier.wait()
+        return file_upload_batch
+
+
+class _BlockingFileUploadBatchViewSet(FileUploadBatchViewSet):
+    storing = None
+    resume = None
+
+    def insert_file_uploads(self, request, file_uploads, checksums):
+        # Blocks after the first file is stored, e.g. like the upload of a large file.
+        store_file = file_uploads[0].store_file
+
+        def blocking_store_file():
+            store_file()
+            self.storing.set()
+            self.resume.wait(30)
+        file_uploads[0].store_file = blocking_store_file
+        return super().insert_file_uploads(request, file_uploads, checksums)
+
+
+class _ClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class _FakeObjectStorageClient:
+    """
+    The methods of a boto3 S3 client that are used by the ObjectFileUploadStorage, on objects in memory. The parts are
+    uploaded slowly, so that parts that are generated ahead of the uploads would pile up.
+    """
+
+    def __init__(self, failing_part_number=None):
+        self.objects = {}
+        self.multipart_uploads = {}
+        self.requests = []
+        self.failing_part_number = failing_part_number
+        self.lock = threading.Lock()
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise _ClientError("404")
+        return {"ContentLength": len(self.objects[Key]), "LastModified": None}
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.requests.append(("get_object", Key, Range))
+        if Key not in self.objects:
+            raise _ClientError("NoSuchKey")
+        start = int(Range.removeprefix("bytes=").removesuffix("-")) if Range else 0
+        return {"Body": io.BytesIO(self.objects[Key][start:])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.requests.append(("put_object", Key, None))
+        self.objects[Key] = bytes(Body)
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.requests.append(("copy_object", Key, None))
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.requests.append(("create_multipart_upload", Key, None))
+        upload_id = uuid.uuid4().hex
+        self.multipart_uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        time.sleep(0.01)
+        if PartNumber == self.failing_part_number:
+            raise _ClientError("InternalError")
+        with self.lock:
+            self.multipart_uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f"{UploadId}-{PartNumber}"}
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange):
+        self.requests.append(("upload_part_copy", Key, CopySourceRange))
+        start, stop = map(int, CopySourceRange.removeprefix("bytes=").split("-"))
+        with self.lock:
+            self.multipart_uploads[UploadId][PartNumber] = self.objects[CopySource["Key"]][start:stop + 1]
+        return {"CopyPartResult": {"ETag": f"{UploadId}-{PartNumber}"}}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.requests.append(("complete_multipart_upload", Key, None))
+        parts = self.multipart_uploads.pop(UploadId)
+        part_numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert part_numbers == sorted(parts), part_numbers
+        self.objects[Key] = b"".join(parts[part_number] for part_number in part_numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.requests.append(("abort_multipart_upload", Key, None))
+        del self.multipart_uploads[UploadId]
+
+
+class _ChunkedContentFile(ContentFile):
+    """Yields the content in chunks of the given size and records how many were read."""
+
+    def __init__(self, content, chunk_size):
+        super().__init__(content)
+        self.chunk_size = chunk_size
+        self.chunks_read = 0
+
+    def chunks(self, chunk_size=None):
+        for start in range(0, self.size, self.chunk_size):
+            self.chunks_read += 1
+            yield self.file.getvalue()[start:start + self.chunk_size]
+
+
+class ObjectFileUploadStorageTests(SimpleTestCase):
+    part_size = 4
+    upload_workers = 2
+
+    def setUp(self):
+        self.client = _FakeObjectStorageClient()
+        self.storage = self.create_storage(self.client)
+
+    def create_storage(self, client):
+        storage = ObjectFileUploadStorage(client=client, bucket="test", prefix="prefix/", part_size=self.part_size,
+                                          upload_workers=self.upload_workers)
+        self.addCleanup(lambda: "_upload_pool" in storage.__dict__ and storage._upload_pool.shutdown())
+        return storage
+
+    def request_names(self):
+        return [request[0] for request in self.client.requests]
+
+    def test_small_file_is_put_with_a_single_request(self):
+        self.assertEqual(self.storage.save("a/file.txt", ContentFile(b"abc")), "a/file.txt")
+        self.assertEqual(self.client.objects, {"prefix/a/file.txt": b"abc"})
+        self.assertEqual(self.request_names(), ["put_object"])
+        with self.storage.open("a/file.txt") as file:
+            self.assertEqual(file.size, 3)
+            self.assertEqual(file.read(), b"abc")
+
+    def test_large_file_is_uploaded_in_parts_with_a_bounded_number_pending(self):
+        data = bytes(range(50))
+        content = _ChunkedContentFile(data, self.part_size)
+        uploaded_part_numbers = []
+        pending_part_counts = []
+        upload_part = self.client.upload_part
+
+        def counting_upload_part(**kwargs):
+            # The parts that were read but are not uploaded yet are at most the ones of the workers, the one that is
+            # waited for and the two that are read ahead to tell a small file apart.
+            pending_part_counts.append(content.chunks_read - len(uploaded_part_numbers))
+            result = upload_part(**kwargs)
+            uploaded_part_numbers.append(kwargs["PartNumber"])
+            return result
+        self.client.upload_part = counting_upload_part
+        self.storage.save("file.bin", content)
+        self.assertEqual(self.client.objects["prefix/file.bin"], data)
+        self.assertEqual(sorted(uploaded_part_numbers), list(range(1, 14)))
+        self.assertLessEqual(max(pending_part_counts), self.upload_workers + 3)
+        self.assertEqual(self.request_names(), ["create_multipart_upload", "complete_multipart_upload"])
+        self.assertEqual(self.client.multipart_uploads, {})
+
+    def test_failed_multipart_upload_is_aborted(self):
+        self.client.failing_part_number = 3
+        with self.assertRaises(_ClientError):
+            self.storage.save("file.bin", ContentFile(bytes(50)))
+        self.assertEqual(self.request_names(), ["create_multipart_upload", "abort_multipart_upload"])
+        self.assertEqual(self.client.objects, {})
+        self.assertEqual(self.client.multipart_uploads, {})
+
+    def test_reader_sends_ranged_requests_from_the_seeked_positions(self):
+        self.client.objects["prefix/file.bin"] = bytes(range(20))
+        reader = _ObjectReader(self.storage, "prefix/file.bin", 20)
+        self.assertEqual(self.client.requests, [])
+        self.assertEqual(reader.seek(5), 5)
+        self.assertEqual(reader.read(3), bytes((5, 6, 7)))
+        self.assertEqual(reader.read(2), bytes((8, 9)))
+        self.assertEqual(reader.seek(-4, io.SEEK_END), 16)
+        self.assertEqual(reader.read(), bytes((16, 17, 18, 19)))
+        self.assertEqual(reader.read(1), b"")
+        self.assertEqual(reader.seek(-18, io.SEEK_CUR), 2)
+        self.assertEqual(reader.read(1), bytes((2,)))
+        self.assertEqual(self.client.requests, [("get_object", "prefix/file.bin", "bytes=5-"),
+                                                ("get_object", "prefix/file.bin", "bytes=16-"),
+                                                ("get_object", "prefix/file.bin", "bytes=2-")])
+        reader.close()
+
+    def test_link_copies_small_objects_with_a_single_request(self):
+        self.client.objects["prefix/source.bin"] = bytes(range(10))
+        self.storage.link("source.bin", "target.bin")
+        self.assertEqual(self.client.objects["prefix/target.bin"], bytes(range(10)))
+        self.assertEqual(self.request_names(), ["copy_object"])
+
+    @mock.patch("django_fileupload.objectstorage.COPY_PART_SIZE", 4)
+    @mock.patch("django_fileupload.objectstorage.MAXIMUM_COPY_SIZE", 8)
+    def test_link_copies_large_objects_in_parts(self):
+        self.client.objects["prefix/source.bin"] = bytes(range(10))
+        self.storage.link("source.bin", "target.bin")
+        self.assertEqual(self.client.objects["prefix/target.bin"], bytes(range(10)))
+        self.assertEqual(self.request_names(), ["create_multipart_upload", "upload_part_copy", "upload_part_copy",
+                                                "upload_part_copy", "complete_multipart_upload"])
+        self.assertEqual(sorted(request[2] for request in self.client.requests if request[0] == "upload_part_copy"),
+                         ["bytes=0-3", "bytes=4-7", "bytes=8-9"])
+
+    def test_existing_objects_are_not_overwritten(self):
+        self.storage.save("file.txt", ContentFile(b"abc"))
+        with self.assertRaises(FileExistsError):
+            self.storage.save("file.txt", ContentFile(b"def"))
+        with self.assertRaises(FileExistsError):
+            self.storage.link("file.txt", "file.txt")
+        self.assertEqual(self.client.objects, {"prefix/file.txt": b"abc"})
+
+
+class FileUploadBatchTests(SimpleTestCase):
+    """
+    Runs against the existing PostgreSQL database (see django_common.tests.UseExistingDatabaseDiscoverRunner), as the
+    uploads use sequences and advisory locks and the concurrent uploaders need their own connections. The records of
+    the tests are deleted afterwards.
+    """
+    databases = {"default"}
+    uploaders = 4
+    files = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if connection.vendor != "postgresql":
+            raise unittest.SkipTest("Requires PostgreSQL.")
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = get_user_model().objects.create_user(f"file_upload_test_{uuid.uuid4().hex}")
+        self.media_root = tempfile.mkdtemp(prefix="file_upload_test")
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def tearDown(self):
+        FileUploadBatch.objects.filter(owner=self.user).delete()
+        self.user.delete()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, viewset_class=FileUploadBatchViewSet, **initkwargs):
+        files = [SimpleUploadedFile(f"file_{i}.txt", f"{uuid.uuid4()}\n".encode()) for i in range(self.files)]
+        request = self.factory.post("/", {"files": files}, format="multipart")
+        force_authenticate(request, self.user)
+        response = viewset_class.as_view({"post": "create"}, **initkwargs)(request)
+        request.close()
+        return response
+
+    def list_file_uploads(self, file_upload_batch_id):
+        request = self.factory.get("/", {"file_upload_batch": file_upload_batch_id})
+        force_authenticate(request, self.user)
+        response = FileUploadViewSet.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, 200)
+        return [file_upload["id"] for file_upload in response.data["results"]]
+
+    def test_concurrent_uploads_overlap(self):
+        barrier = threading.Barrier(self.uploaders, timeout=30)
+
+        def upload():
+            try:
+                return self.upload(_BarrierFileUploadBatchViewSet, barrier=barrier)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.uploaders) as pool:
+            responses = list(pool.map(lambda _: upload(), range(self.uploaders)))
+        self.assertFalse(barrier.broken)
+        for response in responses:
+            self.assertEqual(response.status_code, 201)
+            ids = [file_upload["id"] for file_upload in response.data]
+            self.assertEqual(ids, sorted(ids))
+            self.assertEqual(
+                list(FileUpload.objects.filter(id__in=ids).order_by("position").values_list("id", flat=True)), ids
+            )
+        self.assertEqual(FileUploadBatch.objects.filter(owner=self.user).count(), self.uploaders)
+
+    def test_other_advisory_locks_do_not_hide_file_uploads(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(1), pg_advisory_lock(1, 1)")
+        try:
+            response = self.upload()
+            self.assertEqual(response.status_code, 201)
+            file_upload_batch_id = FileUpload.objects.get(id=response.data[0]["id"]).file_upload_batch_id
+            self.assertEqual(self.list_file_uploads(file_upload_batch_id),
+                             [file_upload["id"] for file_upload in response.data])
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(1), pg_advisory_unlock(1, 1)")
+
+    def test_file_uploads_are_listed_while_other_files_are_stored(self):
+        storing = threading.Event()
+        resume = threading.Event()
+
+        def upload():
+            try:
+                return self.upload(_BlockingFileUploadBatchViewSet, storing=storing, resume=resume)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            blocked_response = pool.submit(upload)
+            try:
+                self.assertTrue(storing.wait(30))
+                response = self.upload()
+                self.assertEqual(response.status_code, 201)
+                file_upload_batch_id = FileUpload.objects.get(id=response.data[0]["id"]).file_upload_batch_id
+                self.assertEqual(self.list_file_uploads(file_upload_batch_id),
+                                 [file_upload["id"] for file_upload in response.data])
+            finally:
+                resume.set()
+            self.assertEqual(blocked_response.result().status_code, 201)
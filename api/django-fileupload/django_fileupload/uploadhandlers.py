@@ -0,0 +1,178 @@
+import hashlib
+import os
+import tempfile
+import threading
+from os import environ
+
+import magic
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.utils.translation import gettext_lazy as _
+from rest_framework.serializers import ValidationError
+
+from django_fileupload.lineindex import LINE_INDEX_INTERVAL, LineIndexBuilder
+
+"""
+To calculate the checksum and to detect the MIME type of the uploaded files while the data streams in (instead of
+reading the files again after they were stored), add the following to the settings.py file:
+
+FILE_UPLOAD_HANDLERS = [
+    "django_fileupload.uploadhandlers.IngestMemoryFileUploadHandler",
+    "django_fileupload.uploadhandlers.IngestTemporaryFileUploadHandler",
+]
+
+Large files are spooled to a temporary file. If it is on the same filesystem as the file upload storage, the storage
+renames it instead of copying all its bytes. To spool into a directory of the file upload storage, use the
+"IngestSpoolTemporaryFileUploadHandler" instead of the "IngestTemporaryFileUploadHandler" (or the
+"SpoolTemporaryFileUploadHandler" instead of Django's "TemporaryFileUploadHandler").
+
+To reject uploads that would exceed the storage quota of the user (see FileUploadQuota) before the data is received,
+add the "QuotaFileUploadHandler" as the first file upload handler.
+
+The mixin can also be combined with other file upload handlers, e.g. with the ones from django_common:
+
+class HardLimitIngestTemporaryFileUploadHandler(IngestFileUploadHandlerMixin, HardLimitTemporaryFileUploadHandler):
+    pass
+"""
+
+# The number of bytes from the beginning of a file that are used to detect its MIME type.
+MIME_TYPE_DETECTION_BUFFER_SIZE = int(environ.get("DJANGO_FILEUPLOAD_MIME_TYPE_DETECTION_BUFFER_SIZE", 1048576))
+# Must be on the same filesystem as the file upload storage, by default it is a directory within the storage (or the
+# temporary directory if the storage has no local paths, e.g. an object storage).
+SPOOL_DIRECTORY = environ.get("DJANGO_FILEUPLOAD_SPOOL_DIRECTORY")
+
+
+_magic = threading.local()
+
+
+def _get_mime_magic():
+    # The functions of the magic module share an instance whose lock would serialize the detection across the threads
+    # (e.g. of the processing pool), so every thread has its own.
+    mime_magic = getattr(_magic, "mime", None)
+    if mime_magic is None:
+        mime_magic = _magic.mime = magic.Magic(mime=True)
+    return mime_magic
+
+
+def detect_mime_type_from_buffer(buffer):
+    return _get_mime_magic().from_buffer(buffer)
+
+
+def detect_mime_type_from_file(path):
+    return _get_mime_magic().from_file(path)
+
+
+def get_spool_directory():
+    if SPOOL_DIRECTORY:
+        return SPOOL_DIRECTORY
+    from .models import FileUpload
+    try:
+        return FileUpload.file.field.storage.path(".spool")
+    except NotImplementedError:
+        return settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+
+
+class SpoolTemporaryUploadedFile(TemporaryUploadedFile):
+    """
+    A temporary uploaded file in the spool directory.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        directory = get_spool_directory()
+        os.makedirs(directory, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + ext, dir=directory)
+        # Skips the constructor of TemporaryUploadedFile which would create the file in FILE_UPLOAD_TEMP_DIR.
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+
+
+class SpoolTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools the uploaded files into the spool directory, from where the file upload storage can promote them with a
+    rename.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Skips the method of TemporaryFileUploadHandler which would create a TemporaryUploadedFile.
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self.file = SpoolTemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset,
+                                               self.content_type_extra)
+
+
+class IngestFileUploadHandlerMixin:
+    """
+    Adds the "checksum", the "detected_mime_type" and, for text files, the "line_index_builder" (see lineindex.py)
+    attributes to the uploaded files.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Must be initialized first as the super method may raise StopFutureHandlers.
+        self.sha256 = hashlib.sha256()
+        self.header = bytearray()
+        self.detected_mime_type = None
+        self.line_index_builder = LineIndexBuilder() if LINE_INDEX_INTERVAL else None
+        super().new_file(*args, **kwargs)
+
+    def detect_mime_type(self):
+        from .models import is_text_mime_type
+        self.detected_mime_type = detect_mime_type_from_buffer(bytes(self.header))
+        # Only text files are indexed.
+        if not is_text_mime_type(self.detected_mime_type):
+            self.line_index_builder = None
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+        # Only the handler that consumes the data (i.e. does not pass it on) creates the file.
+        if data is None:
+            self.sha256.update(raw_data)
+            if self.detected_mime_type is None:
+                self.header += raw_data[:MIME_TYPE_DETECTION_BUFFER_SIZE - len(self.header)]
+                if len(self.header) >= MIME_TYPE_DETECTION_BUFFER_SIZE:
+                    self.detect_mime_type()
+            if self.line_index_builder is not None:
+                self.line_index_builder.update(raw_data)
+        return data
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            if self.detected_mime_type is None:
+                self.detect_mime_type()
+            file.checksum = self.sha256.hexdigest()
+            file.detected_mime_type = self.detected_mime_type
+            if self.line_index_builder is not None:
+                file.line_index_builder = self.line_index_builder
+        return file
+
+
+class IngestMemoryFileUploadHandler(IngestFileUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class IngestTemporaryFileUploadHandler(IngestFileUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+class IngestSpoolTemporaryFileUploadHandler(IngestFileUploadHandlerMixin, SpoolTemporaryFileUploadHandler):
+    pass
+
+
+class QuotaFileUploadHandler(FileUploadHandler):
+    """
+    Rejects an upload whose Content-Length exceeds the remaining storage quota of the user, before the data is received.
+    The exact sizes are checked again when the file uploads are inserted.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        user = getattr(self.request, "user", None)
+        if user is not None and user.is_authenticated:
+            from .models import FileUploadQuota
+            if FileUploadQuota.exceeds(user.id, content_length, 0, lock=False):
+                raise ValidationError(_("The upload exceeds the storage quota."))
+
+    def receive_data_chunk(self, raw_data, start):
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -1,7 +1,16 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from django_fileupload.views import FileUploadBatchViewSet, FileUploadViewSet
+from django_fileupload.views import (FileUploadBatchViewSet, FileUploadSessionViewSet, FileUploadViewSet,
+                                     asynchronous_download_view)
 
 router = DefaultRouter()
 router.register("fileupload", FileUploadViewSet, basename="fileupload")
 router.register("fileuploadbatch", FileUploadBatchViewSet, basename="fileuploadbatch")
+router.register("fileuploadsession", FileUploadSessionViewSet, basename="fileuploadsession")
+
+# Under ASGI, e.g. path("api/", include(urlpatterns + router.urls)).
+urlpatterns = [
+    path("fileupload/<int:pk>/asynchronousdownload/", asynchronous_download_view(),
+         name="fileupload-asynchronous-download"),
+]
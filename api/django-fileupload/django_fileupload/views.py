@@ -1,27 +1,101 @@
+import json
 import os
-from os import path
+import re
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
 
-from django.http import FileResponse
+from asgiref.sync import sync_to_async
+from django.db import connections, transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
 from django.utils.translation import gettext_lazy as _
-from drf_spectacular.utils import extend_schema
-from python_utilities.crypto import generate_checksum_from_chunks
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from python_utilities.crypto import generate_checksum_from_chunks, generate_checksum_from_file, generate_merkle_tree
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.parsers import MultiPartParser
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
 
-from django_common.postgresql import exclusive_insert_table_lock
+from django_common.postgresql import advisory_transaction_lock, allocation_horizon, in_flight_ids
 from django_common.renderers import PassthroughRenderer
-from django_fileupload.models import FileUpload, FileUploadBatch
-from django_fileupload.serializers import (FileUploadBatchCreateSerializer, FileUploadBatchSerializer,
-                                           FileUploadSerializer)
+from django_fileupload.archives import stream_zip
+from django_fileupload.compression import accepts_content_encoding
+from django_fileupload.models import (ASYNCHRONOUS_PROCESSING, FileUpload, FileUploadBatch, FileUploadLineIndex,
+                                      FileUploadQuota, FileUploadReference, FileUploadSession, FileUploadStatus,
+                                      detect_mime_type, is_text_mime_type, read_lines)
+from django_fileupload.responses import conditional_response, content_disposition, file_response
+from django_fileupload.serializers import (FilePreflightResultSerializer, FileUploadBatchBulkDeleteResultSerializer,
+                                           FileUploadBatchBulkDeleteSerializer, FileUploadBatchCreateSerializer,
+                                           FileUploadBatchMerkleSerializer, FileUploadBatchPreflightSerializer,
+                                           FileUploadBatchProcessingSerializer, FileUploadBatchSerializer,
+                                           FileUploadBatchSessionsSerializer, FileUploadLinesSerializer,
+                                           FileUploadSerializer, FileUploadSessionSerializer)
+
+# The number of threads per process that verify the files of batches and calculate their checksums and MIME types.
+PROCESSING_WORKERS = int(environ.get("DJANGO_FILEUPLOAD_PROCESSING_WORKERS", os.cpu_count() or 1))
+CHUNK_CHECKSUM_HEADER = "X-Chunk-Checksum"
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+MAXIMUM_CHUNK_SIZE = int(environ.get("DJANGO_FILEUPLOAD_MAXIMUM_CHUNK_SIZE", 67108864))
+PAGE_SIZE = int(environ.get("DJANGO_FILEUPLOAD_PAGE_SIZE", 100))
+# The maximum number of lines and bytes of a response with lines of a text file.
+MAXIMUM_LINES = int(environ.get("DJANGO_FILEUPLOAD_MAXIMUM_LINES", 10000))
+MAXIMUM_LINES_SIZE = int(environ.get("DJANGO_FILEUPLOAD_MAXIMUM_LINES_SIZE", 16777216))
+# The maximum number of nodes of the Merkle tree of a batch per response.
+MAXIMUM_MERKLE_NODES = 10000
+
+_processing_pool = ThreadPoolExecutor(max_workers=PROCESSING_WORKERS, thread_name_prefix="fileupload-processing")
+
+
+def _map_in_processing_pool(function, *iterables):
+    # hashlib and libmagic release the GIL (and every thread has its own libmagic instance, see uploadhandlers.py), so
+    # the files are processed in parallel.
+    if PROCESSING_WORKERS > 1:
+        def call_in_worker(*args):
+            try:
+                return function(*args)
+            finally:
+                # The function may have opened database connections in the worker thread (but not in the request
+                # thread, whose connection must stay open, e.g. for ATOMIC_REQUESTS).
+                connections.close_all()
+
+        return _processing_pool.map(call_in_worker, *iterables)
+    return map(function, *iterables)
+
+
+class FileUploadCursorPagination(CursorPagination):
+    """
+    Paginates with the id of the last file upload of the previous page (keyset pagination), so that the response time
+    does not depend on the position of the page.
+    """
+    ordering = "id"
+    page_size = PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # The file uploads whose ids were allocated after the ids of an upload in progress are only listed after it is
+        # committed, as a cursor behind them would skip its file uploads.
+        horizon = allocation_horizon(FileUpload)
+        if horizon is not None:
+            queryset = queryset.filter(id__lt=horizon)
+        return super().paginate_queryset(queryset, request, view)
 
 
 class FileUploadBatchViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     permission_classes = (IsAuthenticated,)
-    queryset = FileUploadBatch.objects.all()
+    # The batches that are marked as deleted are hidden until they are deleted by the file_upload_deleter.
+    queryset = FileUploadBatch.objects.filter(deleted_on__isnull=True).prefetch_related(
+        Prefetch("file_uploads", queryset=FileUpload.objects.order_by("position"))
+    )
     serializer_class = FileUploadBatchSerializer
     parser_classes = (MultiPartParser,)
 
@@ -45,72 +119,441 @@ class FileUploadBatchViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     def verify_file_count(self, request, count):
         return True
 
+    def process_file(self, request, file_position, file):
+        """
+        Verifies a file and calculates its checksum and its MIME type (if they were not calculated while the file was
+        received). Runs in a thread of the processing pool, in parallel with the other files of the batch.
+        If the processing is asynchronous, only the name of the file (and its checksum if it was calculated while the
+        file was received) is verified.
+        """
+        file_name_parts = os.path.splitext(file.name)
+        if self.verify_file_extension(request, file_position, file_name_parts):
+            if self.verify_file_name(request, file_position, file_name_parts, file.name):
+                checksum = getattr(file, "checksum", None)
+                if ASYNCHRONOUS_PROCESSING and not checksum:
+                    # The file is processed and its checksum verified by the file_upload_processor management command.
+                    return ""
+                checksum = checksum or generate_checksum_from_chunks(file.chunks())
+                if self.verify_file_checksum(
+                        request,
+                        file_position,
+                        file_name_parts,
+                        checksum
+                ):
+                    # Prevents that FileUpload.save(...) reads the file again.
+                    file.checksum = checksum
+                    if not ASYNCHRONOUS_PROCESSING and not getattr(file, "detected_mime_type", None):
+                        file.detected_mime_type = detect_mime_type(file)
+                    return checksum
+                raise ValidationError(_("Incorrect or no checksums in the request."))
+            raise ValidationError(_("Files with incorrect name in the request."))
+        raise ValidationError(_("Files with incorrect extension in the request."))
+
+    def create_file_uploads(self, request, files):
+        len_files = len(files)
+        if self.verify_file_count(request, len_files):
+            # The results are collected in the order of the positions, so the first incorrect file (and not the first
+            # file whose processing fails) defines the error.
+            checksums = list(_map_in_processing_pool(
+                lambda file_position, file: self.process_file(request, file_position, file),
+                range(len_files),
+                files,
+            ))
+            response = self.insert_file_uploads(request, [
+                FileUpload(position=file_position, file=file) for file_position, file in enumerate(files)
+            ], checksums)
+            return Response(response, status=status.HTTP_201_CREATED)
+        raise ValidationError(_("Incorrect number of files in the request."))
+
+    def insert_file_uploads(self, request, file_uploads, checksums):
+        """
+        Stores the files of the file uploads and inserts the records into a file upload batch.
+        The files are stored under staging names before the critical section, so concurrent uploads only wait for each
+        other to insert the records of the same batch. Then the ids are allocated (ascending with the positions) and
+        the files are moved to their paths, which contain them. The ids are in flight until the records are inserted,
+        so that readers paging by id do not skip them (see django_common.postgresql.allocation_horizon), but not while
+        the files are stored.
+        """
+        len_files = len(file_uploads)
+        stored_file_uploads = []
+        inserted_file_uploads = []
+        try:
+            for file_upload in file_uploads:
+                file_upload.store_file()
+                stored_file_uploads.append(file_upload)
+            response = []
+            with in_flight_ids(FileUpload, len_files) as file_upload_ids, transaction.atomic():
+                for file_upload, file_upload_id in zip(file_uploads, file_upload_ids):
+                    file_upload.id = file_upload_id
+                    file_upload.promote_file()
+                # Metadata needs to be added here as the insertion of the file uploads may depend on it.
+                file_upload_batch = self.add_metadata(request,
+                                                      lambda: FileUploadBatch.objects.create(owner=request.user))
+                with advisory_transaction_lock(FileUploadBatch, file_upload_batch.id):
+                    previous_file_uploads = {
+                        file_upload.position: file_upload
+                        for file_upload in FileUpload.objects.filter(file_upload_batch=file_upload_batch,
+                                                                     position__lt=len_files)
+                    }
+                    new_file_uploads = []
+                    for file_position, file_upload in enumerate(file_uploads):
+                        previous_file_upload = previous_file_uploads.get(file_position)
+                        if previous_file_upload is None:
+                            file_upload.file_upload_batch = file_upload_batch
+                            new_file_uploads.append(file_upload)
+                            response.append({"id": file_upload.id, "name": file_upload.name})
+                        elif previous_file_upload.checksum and previous_file_upload.checksum == (
+                                checksums[file_position] or file_upload.calculate_checksum()):
+                            response.append({"id": previous_file_upload.id, "name": previous_file_upload.name})
+                        else:
+                            raise ValidationError(_("The checksum of a file in the current upload does not match "
+                                                    "the checksum of the previously uploaded file at the same "
+                                                    "position."))
+                    if FileUploadQuota.exceeds(file_upload_batch.owner_id,
+                                               sum(file_upload.size for file_upload in new_file_uploads),
+                                               len(new_file_uploads)):
+                        raise ValidationError(_("The upload exceeds the storage quota."))
+                    inserted_file_uploads = FileUpload.bulk_insert(new_file_uploads)
+        except BaseException:
+            # Nothing was inserted as the transaction was rolled back.
+            inserted_file_uploads = []
+            raise
+        finally:
+            for file_upload in stored_file_uploads:
+                if file_upload not in inserted_file_uploads:
+                    file_upload.discard_file()
+        return response
+
     @extend_schema(
         request=FileUploadBatchCreateSerializer,
         responses=FileUploadBatchSerializer,
     )
     def create(self, request, *args, **kwargs):
-        if request.FILES:
-            files = request.FILES.getlist("files")
-            len_files = len(files)
-            if self.verify_file_count(request, len_files):
-                checksums = [None] * len_files
-                for file_position, file in enumerate(files):
-                    file_name_parts = os.path.splitext(file.name)
-                    if self.verify_file_extension(request, file_position, file_name_parts):
-                        if self.verify_file_name(request, file_position, file_name_parts, file.name):
-                            checksum = generate_checksum_from_chunks(file.chunks())
-                            if self.verify_file_checksum(
-                                    request,
-                                    file_position,
-                                    file_name_parts,
-                                    checksum
-                            ):
-                                checksums[file_position] = checksum
-                                continue
-                            raise ValidationError(_("Incorrect or no checksums in the request."))
-                        raise ValidationError(_("Files with incorrect name in the request."))
-                    raise ValidationError(_("Files with incorrect extension in the request."))
-                response = []
-                with exclusive_insert_table_lock(FileUploadBatch):
-                    # Metadata needs to be added here as FileUpload.objects.create(...) may depend on it.
-                    file_upload_batch = self.add_metadata(request,
-                                                          lambda: FileUploadBatch.objects.create(owner=request.user))
-                    for file_position, file in enumerate(files):
-                        try:
-                            file_upload = FileUpload.objects.get(file_upload_batch=file_upload_batch,
-                                                                 position=file_position)
-                            if checksums[file_position] == file_upload.checksum:
-                                response.append({"id": file_upload.id, "name": file_upload.name})
-                                continue
-                            raise ValidationError(_("The checksum of a file in the current upload does not match the "
-                                                    "checksum of the previously uploaded file at the same position."))
-                        except FileUpload.DoesNotExist:
-                            file_upload = FileUpload.objects.create(
-                                file_upload_batch=file_upload_batch,
-                                position=file_position,
-                                file=file,
-                            )
-                            response.append({"id": file_upload.id, "name": file_upload.name})
-                            continue
-                    return Response(response, status=status.HTTP_201_CREATED)
-            raise ValidationError(_("Incorrect number of files in the request."))
+        files = request.FILES.getlist("files")
+        references = self.get_references(request)
+        if files or references:
+            len_files = len(files) + len(references)
+            if any(not 0 <= file_position < len_files for file_position in references):
+                raise ValidationError(_("Incorrect positions of the references in the request."))
+            uploaded_files = iter(files)
+            return self.create_file_uploads(request, [
+                references[file_position] if file_position in references else next(uploaded_files)
+                for file_position in range(len_files)
+            ])
         raise ValidationError(_("No files in the request."))
 
+    def get_readable_file_uploads(self, request):
+        """The file uploads that can be referenced in a file upload batch, by default the own ones."""
+        return FileUpload.objects.filter(file_upload_batch__owner=request.user,
+                                         file_upload_batch__deleted_on__isnull=True, status=FileUploadStatus.PROCESSED)
+
+    def get_references(self, request):
+        try:
+            references = {
+                int(file_position): int(file_upload_id)
+                for file_position, file_upload_id in json.loads(request.data.get("references") or "{}").items()
+            }
+        except (AttributeError, TypeError, ValueError):
+            raise ValidationError(_("Malformed references in the request."))
+        file_uploads = self.get_readable_file_uploads(request).in_bulk(set(references.values()))
+        if len(file_uploads) != len(set(references.values())):
+            raise ValidationError(_("Unknown file uploads in the references of the request."))
+        return {
+            file_position: FileUploadReference(file_uploads[file_upload_id])
+            for file_position, file_upload_id in references.items()
+        }
+
+    @extend_schema(
+        request=FileUploadBatchPreflightSerializer,
+        responses=FilePreflightResultSerializer(many=True),
+    )
+    @action(detail=False, methods=("post",), parser_classes=(JSONParser,))
+    def preflight(self, request, *args, **kwargs):
+        """
+        Looks up which files (by their checksum and size) are already stored and readable, so that they can be
+        referenced when the file upload batch is created instead of being uploaded again.
+        """
+        serializer = FileUploadBatchPreflightSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        files = serializer.validated_data["files"]
+        candidates = {}
+        for file_upload_id, checksum, original_size, file_name in self.get_readable_file_uploads(request).filter(
+                checksum__in={file["checksum"].lower() for file in files}
+        ).order_by("id").values_list("id", "checksum", "original_size", "file"):
+            candidates.setdefault((checksum, original_size), []).append((file_upload_id, os.path.basename(file_name)))
+        response = []
+        for file in files:
+            matches = candidates.get((file["checksum"].lower(), file["size"]), ())
+            # A file upload with the same name is preferred, as a referenced file keeps its name.
+            file_upload_id = next((i for i, name in matches if name == file["name"]),
+                                  matches[0][0] if matches else None)
+            response.append({"name": file["name"], "file_upload": file_upload_id})
+        return Response(FilePreflightResultSerializer(response, many=True).data)
+
+    @extend_schema(
+        request=FileUploadBatchSessionsSerializer,
+        responses=FileUploadBatchSerializer,
+    )
+    @action(detail=False, methods=("post",), parser_classes=(JSONParser,))
+    def sessions(self, request, *args, **kwargs):
+        """Commits complete file upload sessions into a file upload batch."""
+        serializer = FileUploadBatchSessionsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["sessions"]
+        file_upload_sessions = FileUploadSession.objects.in_bulk(ids)
+        if len(file_upload_sessions) != len(ids) or any(
+                s.owner_id != request.user.id for s in file_upload_sessions.values()):
+            raise ValidationError(_("Unknown upload sessions in the request."))
+        files = []
+        try:
+            for file_upload_session in (file_upload_sessions[i] for i in ids):
+                if not file_upload_session.is_complete:
+                    raise ValidationError(_("Incomplete upload sessions in the request."))
+                file = file_upload_session.open()
+                files.append(file)
+                file.checksum = generate_checksum_from_file(file_upload_session.path)
+                if file_upload_session.checksum and file_upload_session.checksum != file.checksum:
+                    raise ValidationError(_("The checksum of a file in the current upload does not match the "
+                                            "checksum announced when the upload session was opened."))
+            response = self.create_file_uploads(request, files)
+        finally:
+            for file in files:
+                file.close()
+        for file_upload_session in file_upload_sessions.values():
+            file_upload_session.discard()
+        return response
+
+    def get_deletable_file_upload_batches(self, request):
+        """The file upload batches that can be deleted, by default the own ones."""
+        return FileUploadBatch.objects.filter(owner=request.user)
+
+    @extend_schema(
+        request=FileUploadBatchBulkDeleteSerializer,
+        responses={202: FileUploadBatchBulkDeleteResultSerializer},
+    )
+    @action(detail=False, methods=("post",), parser_classes=(JSONParser,))
+    def bulk_delete(self, request, *args, **kwargs):
+        """
+        Marks file upload batches as deleted with a single statement and answers immediately. Their file uploads and
+        files are deleted in the background by the file_upload_deleter management command.
+        """
+        serializer = FileUploadBatchBulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data["file_upload_batches"])
+        file_upload_batches = self.get_deletable_file_upload_batches(request).filter(pk__in=ids)
+        # Batches that are already marked as deleted are accepted, so that the request can be repeated.
+        if file_upload_batches.count() != len(ids):
+            raise ValidationError(_("Unknown file upload batches in the request."))
+        deleted = FileUploadBatch.mark_deleted(file_upload_batches)
+        return Response(FileUploadBatchBulkDeleteResultSerializer({"deleted": deleted}).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("level", int, description="The level of the nodes (0 for the leaves)."),
+            OpenApiParameter("start", int, description="The index of the first node of the level."),
+        ],
+        responses=FileUploadBatchMerkleSerializer,
+    )
+    @action(detail=True, methods=("get",))
+    def merkle(self, request, *args, **kwargs):
+        """
+        Returns nodes of the Merkle tree over the (position, checksum, size) of the files of a file upload batch, e.g.
+        to find the files that differ from a copy by descending from the root into the nodes that do not match.
+        """
+        file_upload_batch = self.get_object()
+        levels = generate_merkle_tree(FileUploadBatch.generate_merkle_leaves(
+            (file_upload.position, file_upload.checksum, file_upload.original_size)
+            for file_upload in file_upload_batch.file_uploads.all()
+        ))
+        try:
+            level = int(request.query_params.get("level", 0))
+            start = int(request.query_params.get("start", 0))
+        except ValueError:
+            raise ValidationError(_("Malformed Merkle tree nodes in the request."))
+        if not 0 <= level < len(levels) or start < 0:
+            raise ValidationError(_("Malformed Merkle tree nodes in the request."))
+        return Response(FileUploadBatchMerkleSerializer({
+            "merkle_root": levels[-1][0].hex(),
+            "height": len(levels) - 1,
+            "level": level,
+            "node_count": len(levels[level]),
+            "start": start,
+            "nodes": [node.hex() for node in levels[level][start:start + MAXIMUM_MERKLE_NODES]],
+        }).data)
+
+    @extend_schema(responses=FileUploadBatchProcessingSerializer)
+    @action(detail=True, methods=("get",))
+    def processing(self, request, *args, **kwargs):
+        """Reports the progress of the asynchronous processing of the files of a file upload batch."""
+        file_upload_batch = self.get_object()
+        file_uploads = list(file_upload_batch.file_uploads.all())
+        counts = Counter(file_upload.status for file_upload in file_uploads)
+        return Response(FileUploadBatchProcessingSerializer({
+            **{s: counts[s] for s in FileUploadStatus.values},
+            "file_uploads": file_uploads,
+        }).data)
+
+    @extend_schema(
+        parameters=[OpenApiParameter("compress", bool, description="Compresses text files with deflate.")],
+        responses={(200, "application/zip"): OpenApiTypes.BINARY},
+    )
+    @action(detail=True, methods=("get",), renderer_classes=(PassthroughRenderer,))
+    def download(self, request, *args, **kwargs):
+        """Streams all files of a file upload batch as a ZIP archive."""
+        file_upload_batch = self.get_object()
+        compress = request.query_params.get("compress", "").lower() in ("1", "true")
+        file_uploads = list(file_upload_batch.file_uploads.all())
+        names = Counter(file_upload.name for file_upload in file_uploads)
+        entries = (
+            (
+                file_upload.name if names[file_upload.name] == 1 else f"{file_upload.position}_{file_upload.name}",
+                file_upload.size,
+                file_upload.checksum,
+                file_upload.open_content,
+                zipfile.ZIP_DEFLATED if compress and is_text_mime_type(file_upload.detected_mime_type)
+                else zipfile.ZIP_STORED,
+            )
+            for file_upload in file_uploads
+        )
+        response = StreamingHttpResponse(
+            stream_zip(entries, timezone.localtime(file_upload_batch.uploaded_on).timetuple()[:6]),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = content_disposition(f"batch_{file_upload_batch.id}.zip")
+        return response
+
+
+class FileUploadSessionViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Resumable upload of a single file in byte ranges (chunks):
+    1. Open a session with the name and the size of the file (POST).
+    2. Send the chunks in any order, also in parallel (PUT .../chunk/) with a
+       Content-Range header and the SHA-256 checksum of the chunk in the
+       X-Chunk-Checksum header.
+    3. Query the offset up to which the file was received without a gap (GET)
+       to resume an interrupted upload.
+    4. Commit the complete sessions into a file upload batch (POST fileuploadbatch/sessions/).
+    """
+    permission_classes = (IsAuthenticated,)
+    queryset = FileUploadSession.objects.all()
+    serializer_class = FileUploadSessionSerializer
+    parser_classes = (JSONParser,)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        # Rejects the upload before any chunk is sent (the quota is checked again when the session is committed).
+        if FileUploadQuota.exceeds(self.request.user.id, serializer.validated_data["size"], 1, lock=False):
+            raise ValidationError(_("The upload exceeds the storage quota."))
+        serializer.save(owner=self.request.user).allocate()
+
+    def perform_destroy(self, instance):
+        instance.discard()
+
+    @extend_schema(request=None, responses=FileUploadSessionSerializer)
+    @action(detail=True, methods=("put",))
+    def chunk(self, request, *args, **kwargs):
+        file_upload_session = self.get_object()
+        match = CONTENT_RANGE_PATTERN.match(request.headers.get("Content-Range", ""))
+        if match is None:
+            raise ValidationError(_("Missing or malformed Content-Range header."))
+        first, last, size = (int(g) for g in match.groups())
+        if size != file_upload_session.size or first > last or last >= size:
+            raise ValidationError(_("The Content-Range header does not match the upload session."))
+        chunk_size = last - first + 1
+        if chunk_size > MAXIMUM_CHUNK_SIZE:
+            raise ValidationError(_("The chunk is too large."))
+        if chunk_size != int(request.headers.get("Content-Length") or 0):
+            raise ValidationError(_("The Content-Length header does not match the Content-Range header."))
+        checksum = request.headers.get(CHUNK_CHECKSUM_HEADER)
+        if not checksum:
+            raise ValidationError(_("No chunk checksum in the request."))
+        if file_upload_session.write_chunk(first, chunk_size, request.stream, checksum.lower()):
+            return Response(self.get_serializer(file_upload_session).data)
+        raise ValidationError(_("Incomplete chunk or incorrect chunk checksum in the request."))
+
 
 class FileDownloadViewSet(viewsets.GenericViewSet):
     permission_classes = (IsAuthenticated,)
-    queryset = FileUpload.objects.all()
+    queryset = FileUpload.objects.filter(file_upload_batch__deleted_on__isnull=True).select_related("file_upload_batch")
+    # Sends the body with an asynchronous iterator (see asynchronous_download_view(...)).
+    asynchronous = False
     serializer_class = FileUploadSerializer
 
     @action(detail=True, methods=("get",), renderer_classes=(PassthroughRenderer,))
     def download(self, request, *args, **kwargs):
         file_upload = self.get_object()
-        response = FileResponse(file_upload.file.open(), content_type=file_upload.detected_mime_type)
-        response["Content-Length"] = file_upload.file.size
-        response["Content-Disposition"] = 'attachment; filename="%s"' % path.basename(file_upload.file.name)
+        # A compressed file is sent as it is stored if the client accepts its encoding, and otherwise decompressed.
+        send_encoded = (
+            file_upload.content_encoding
+            and "HTTP_RANGE" not in request.META
+            and accepts_content_encoding(request, file_upload.content_encoding)
+        )
+        etag = None
+        if file_upload.checksum:
+            etag = quote_etag(f"{file_upload.checksum}-{file_upload.content_encoding}" if send_encoded
+                              else file_upload.checksum)
+        last_modified = file_upload.file_upload_batch.uploaded_on
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            if send_encoded:
+                response = file_response(request, file_upload.file.open, file_upload.file.size,
+                                         file_upload.detected_mime_type, file_upload.name, etag=etag,
+                                         last_modified=last_modified, asynchronous=self.asynchronous)
+                response["Content-Encoding"] = file_upload.content_encoding
+            else:
+                response = file_response(request, file_upload.open_content, file_upload.size,
+                                         file_upload.detected_mime_type, file_upload.name, etag=etag,
+                                         last_modified=last_modified,
+                                         file_path=None if file_upload.content_encoding else file_upload.path,
+                                         asynchronous=self.asynchronous)
+        if file_upload.content_encoding:
+            patch_vary_headers(response, ("Accept-Encoding",))
         return response
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("start", int, description="The first line (counted from 0)."),
+            OpenApiParameter("stop", int, description="The line after the last line."),
+        ],
+        responses=FileUploadLinesSerializer,
+    )
+    @action(detail=True, methods=("get",))
+    def lines(self, request, *args, **kwargs):
+        """
+        Returns the lines [start, stop) of a text file. The file is read from the closest line before the start in its
+        line index, so the response time does not depend on the position of the lines (unless it is compressed).
+        """
+        file_upload = self.get_object()
+        if not is_text_mime_type(file_upload.detected_mime_type):
+            raise ValidationError(_("The file is not a text file."))
+        try:
+            start = int(request.query_params.get("start", 0))
+            stop = int(request.query_params.get("stop", start + MAXIMUM_LINES))
+        except ValueError:
+            raise ValidationError(_("Malformed line range in the request."))
+        if start < 0 or stop < start:
+            raise ValidationError(_("Malformed line range in the request."))
+        line_index = FileUploadLineIndex.objects.filter(file_upload=file_upload).first()
+        offset, offset_line = line_index.locate(start) if line_index is not None else (0, 0)
+        with file_upload.open_content() as file:
+            lines, truncated = read_lines(file, start, min(stop, start + MAXIMUM_LINES), MAXIMUM_LINES_SIZE, offset,
+                                          offset_line)
+        return Response(FileUploadLinesSerializer({
+            "start": start,
+            "stop": start + len(lines),
+            "line_count": line_index.line_count if line_index is not None else None,
+            "lines": [line.rstrip(b"\r\n").decode(errors="replace") for line in lines],
+            "truncated": truncated,
+        }).data)
+
 
 class FileUploadViewSet(
     FileDownloadViewSet,
@@ -119,4 +562,37 @@ class FileUploadViewSet(
     mixins.DestroyModelMixin,
     viewsets.GenericViewSet,
 ):
-    pass
+    pagination_class = FileUploadCursorPagination
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == "list":
+            file_upload_batch = self.request.query_params.get("file_upload_batch")
+            if file_upload_batch is not None:
+                if not file_upload_batch.isdigit():
+                    raise ValidationError(_("Malformed file upload batch in the request."))
+                queryset = queryset.filter(file_upload_batch_id=file_upload_batch)
+        return queryset
+
+    @extend_schema(parameters=[OpenApiParameter("file_upload_batch", int,
+                                                description="Lists only the file uploads of a file upload batch.")])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        # The file is removed only if the deletion of the record is committed, instead of by the garbage collector.
+        transaction.on_commit(instance.discard_file)
+
+
+def asynchronous_download_view(viewset_class=FileUploadViewSet):
+    """
+    Creates an asynchronous (ASGI) view of the download action of a viewset. The authentication, the permission checks
+    and the lookup of the file upload of the viewset run once in a thread, the file is sent without blocking one.
+    """
+    view = sync_to_async(viewset_class.as_view({"get": "download"}, asynchronous=True))
+
+    async def asynchronous_download(request, *args, **kwargs):
+        return await view(request, *args, **kwargs)
+
+    return asynchronous_download
@@ -28,3 +28,29 @@ def generate_checksum_from_chunks(file_chunks):
     for chunk in file_chunks:
         sha256.update(chunk)
     return sha256.hexdigest()
+
+
+def generate_merkle_leaf(position, checksum, size):
+    """Calculates the leaf hash of a file at a position in a Merkle tree over the files of a batch"""
+    # The prefixes distinguish the leaves from the inner nodes (see RFC 6962).
+    return hashlib.sha256(b"\x00" + f"{position}:{checksum}:{size}".encode()).digest()
+
+
+def generate_merkle_tree(leaves):
+    """
+    Calculates the levels of a Merkle tree from its leaf hashes up to its root. An inner node hashes the concatenation of
+    its two children, and an odd last node is promoted to the next level as it is.
+    """
+    levels = [list(leaves) or [hashlib.sha256(b"").digest()]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([
+            hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ])
+    return levels
+
+
+def generate_merkle_root(leaves):
+    """Calculates the root of a Merkle tree from its leaf hashes"""
+    return generate_merkle_tree(leaves)[-1][0].hex()